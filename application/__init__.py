@@ -1,5 +1,35 @@
+import os
 from flask import Flask
 
 app = Flask(__name__)
 
-from application import routes
\ No newline at end of file
+# Upper bound on the processed data each worker keeps in memory (MINDMAP_DATA_CACHE_MB, default 512 MB)
+app.config["DATA_CACHE_BYTES"] = int(os.environ.get("MINDMAP_DATA_CACHE_MB", 512)) * 1024 * 1024
+
+# Rendered figures shared by all workers on disk (MINDMAP_FIGURE_CACHE_DIR, MINDMAP_FIGURE_CACHE_MB, default 256 MB)
+app.config["FIGURE_CACHE_DIR"] = os.environ.get(
+    "MINDMAP_FIGURE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "figure_cache")
+)
+app.config["FIGURE_CACHE_BYTES"] = int(os.environ.get("MINDMAP_FIGURE_CACHE_MB", 256)) * 1024 * 1024
+
+# Memory-mapped session store written by hrCompact.py and shared by all workers (MINDMAP_STORE_DIR)
+app.config["STORE_DIR"] = os.environ.get(
+    "MINDMAP_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "session_store")
+)
+
+# Threads per worker reading data files concurrently, e.g. a session and its metadata (MINDMAP_IO_THREADS, default 4)
+app.config["IO_THREADS"] = int(os.environ.get("MINDMAP_IO_THREADS", 4))
+
+# Seconds between scans of the data folders for new or changed processed files (MINDMAP_WATCH_INTERVAL, 0 = off)
+app.config["WATCH_INTERVAL"] = float(os.environ.get("MINDMAP_WATCH_INTERVAL", 5))
+
+# Log level of debug_summary.log (MINDMAP_LOG_LEVEL, default INFO; DEBUG logs every step of every request)
+app.config["LOG_LEVEL"] = os.environ.get("MINDMAP_LOG_LEVEL", "INFO").upper()
+
+# Requests made with ?profile=1 write their span timeline here (MINDMAP_PROFILE_DIR, unset = header only)
+app.config["PROFILE_DIR"] = os.environ.get("MINDMAP_PROFILE_DIR")
+
+from application import profiling
+profiling.init_app(app)
+
+from application import routes, api
\ No newline at end of file
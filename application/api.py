@@ -0,0 +1,338 @@
+import json
+import logging
+import pandas as pd
+from flask import jsonify, request
+from application import app
+from application.downsample import DEFAULT_PLOT_WIDTH, METHODS, POINTS_PER_PIXEL, downsample, max_points_for_width
+from application.plots import cohort_figure, overview_figure, session_figure
+from application.cache import data_version
+from application.cohort import cohort_statistics, cohort_table, participant_trajectories, records
+from application.profiling import metrics, rss_bytes, span
+from application.routes import (
+    DEFAULT_QUALITY_SORT, QUALITY_VIEW_COLUMNS, catalog, features_path, figure_cache, load_session, quality_view, session_paths,
+    session_pyramid_path, session_store, summary_index, watcher,
+)
+from dataTypes import HEARTRATE, get_data_type
+from hrFeatures import FEATURE_LABELS
+from hrMeta import sublevel_bounds
+from hrPyramid import pick_level
+
+# Largest number of points a single session request may ask for
+MAX_POINTS_LIMIT = 200000
+
+def error_response(message, status):
+    logging.warning(f"API error ({status}): {message}")
+    return jsonify({"error": message}), status
+
+def figure_body(fig, **info):
+    """Plotly figure JSON plus information about what was plotted, e.g. how many points were sent."""
+    return '{"figure": %s, "info": %s}' % (fig.to_json(), json.dumps(info))
+
+def json_response(body):
+    return app.response_class(body, mimetype="application/json")
+
+def data_type_paths(data_type):
+    """Every file of a data type, whose sizes and mtimes version the figures built from them."""
+    return catalog.paths(data_type)
+
+def pyramid_plot_frame(buckets, spec):
+    """
+    Pyramid buckets (see hrPyramid) as a frame to plot: the bucket mean in the first plot column at the middle
+    of each bucket, and the bucket min and max for the range band.
+    """
+    middle = pd.to_timedelta(buckets["level"].to_numpy() / 2, unit="s")
+    return pd.DataFrame({
+        spec.time_column: buckets["start"].to_numpy() + middle,
+        spec.plot_columns[0]: buckets["mean"].to_numpy(),
+        "min": buckets["min"].to_numpy(),
+        "max": buckets["max"].to_numpy(),
+    })
+
+def parse_cohorts(values):
+    """Cohorts from repeated cohort=Name:P1,P2,... parameters, or None to use the default P/N groups."""
+    cohorts = {}
+    for value in values:
+        name, _, members = value.partition(":")
+        if not name or not members:
+            raise ValueError(f"Expected cohort=Name:P1,P2,..., got {value!r}")
+        cohorts[name] = [member.strip() for member in members.split(",") if member.strip()]
+    return cohorts or None
+
+@app.route("/api/catalog")
+def api_catalog():
+    """Participants and sessions available for every data type."""
+    return jsonify({
+        "data_types": {
+            data_type: {participant: catalog.sessions(data_type, participant)
+                        for participant in catalog.participants(data_type)}
+            for data_type in catalog.data_types()
+        },
+        "downsample_methods": list(METHODS),
+        # Method selected by default for each data type, e.g. minmax to keep accelerometer peaks
+        "default_downsample": {data_type: get_data_type(data_type).default_downsample
+                               for data_type in catalog.data_types() if get_data_type(data_type) is not None},
+        "features": FEATURE_LABELS,
+    })
+
+@app.route("/api/overview")
+def api_overview():
+    """Overview figure of one data type: mean of session means for the P and N groups."""
+    data_type = request.args.get("data_type")
+    if data_type not in catalog.data_types():
+        return error_response(f"Unknown data type: {data_type}", 404)
+
+    with span("cache.lookup"):
+        key = figure_cache.key("overview", data_type, data_version(data_type_paths(data_type)))
+        body = figure_cache.get(key)
+    if body is None:
+        with span("overview.summary"):
+            summary = summary_index.table(data_type)
+        with span("overview.figure"):
+            fig = overview_figure(summary, data_type)
+        with span("overview.serialize"):
+            body = figure_body(fig, sessions=len(summary))
+        with span("cache.store"):
+            figure_cache.put(key, body)
+    return json_response(body)
+
+@app.route("/api/cohort")
+def api_cohort():
+    """
+    Cohort comparison of one data type from the per-session summaries: for every cohort and session the
+    median, quartiles, mean and 95% confidence interval of the participants' session means, plus each
+    participant's trajectory. Cohorts default to the P and N groups; repeated cohort=Name:P1,P2 parameters
+    define others, and participants=P1,N2,... limits the analysis to a subset.
+    """
+    data_type = request.args.get("data_type")
+    if data_type not in catalog.data_types():
+        return error_response(f"Unknown data type: {data_type}", 404)
+    try:
+        cohorts = parse_cohorts(request.args.getlist("cohort"))
+    except ValueError as e:
+        return error_response(str(e), 400)
+    subset = request.args.get("participants")
+    subset = sorted({participant.strip() for participant in subset.split(",")}) if subset else None
+
+    with span("cache.lookup"):
+        key = figure_cache.key("cohort", data_type, cohorts, subset, data_version(data_type_paths(data_type)))
+        body = figure_cache.get(key)
+    if body is not None:
+        return json_response(body)
+
+    with span("cohort.summary"):
+        summary = summary_index.table(data_type)
+    if subset is not None:
+        summary = summary[summary["participant"].isin(subset)]
+    with span("cohort.statistics"):
+        table = cohort_table(summary, cohorts)
+        statistics = cohort_statistics(table)
+        trajectories = participant_trajectories(table)
+    with span("cohort.figure"):
+        fig = cohort_figure(table, statistics, data_type)
+    with span("cohort.serialize"):
+        body = figure_body(
+            fig,
+            cohorts={cohort: members["participant"].unique().tolist() for cohort, members in table.groupby("cohort")},
+            statistics=records(statistics),
+            trajectories={participant: row for participant, row in zip(
+                trajectories.index, records(trajectories))},
+        )
+    figure_cache.put(key, body)
+    return json_response(body)
+
+class SessionViewError(Exception):
+    """A session view that can't be built, with the HTTP status to answer with."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+def session_view(participant, session, spec, time_range=None, max_points=None, method=None, features=(),
+                 feature_file=None, pyramid_file=None):
+    """
+    Session figure of a data type (a dataTypes descriptor) and the information sent with it. time_range is a
+    (start, end) pair of Timestamps, either of them None, or None for the whole session. Drawn from the
+    pyramid file when one is given and a level is fine enough, otherwise from the samples with the feature
+    columns of feature_file. Raises SessionViewError if the session can't be plotted.
+    Shared by /api/session and the batch export (hrExport.py).
+    """
+    data_type = spec.name
+    max_points = max_points or max_points_for_width(DEFAULT_PLOT_WIDTH)
+    method = method or spec.default_downsample
+
+    buckets = None
+    if pyramid_file is not None:
+        with span("load.pyramid"):
+            pyramid = catalog.load(pyramid_file)
+            buckets = pick_level(pyramid, *(time_range or (None, None)), min_buckets=max_points // POINTS_PER_PIXEL)
+
+    if buckets is not None:
+        metadata_file = session_paths(participant, session, data_type)[1]
+        with span("load.metadata"):
+            metadata = catalog.load(metadata_file) if metadata_file else None
+        level = float(buckets["level"].iloc[0])
+        window = pyramid_plot_frame(buckets, spec)
+        window_points = int(buckets["rows"].sum())
+        total_points = int(pyramid.loc[pyramid["level"] == level, "rows"].sum())
+    else:
+        session_arrays, metadata = load_session(participant, session, data_type, time_range)
+        if session_arrays is None:
+            raise SessionViewError(f"No processed session data found for {participant}, {session}", 404)
+
+        feature_df = None
+        if features:
+            with span("load.features"):
+                feature_df = catalog.load(feature_file)
+            # Feature rows line up with the session rows they were computed from; a stale file doesn't
+            last_row = session_arrays.first_row + len(session_arrays) - 1
+            if len(feature_df) != session_arrays.total_rows or (len(session_arrays) and
+                    feature_df["watch_timestamp"].iloc[last_row] != session_arrays.timestamp(-1)):
+                raise SessionViewError(
+                    f"Features of {participant}, {session} are out of date; rerun hrFeatures.py", 409)
+
+        with span("session.window"):
+            first, last = session_arrays.bounds(*time_range) if time_range is not None else (0, len(session_arrays))
+            # Only the rows in view are decoded from the compact session
+            window = session_arrays.frame(first, last)
+            if feature_df is not None:
+                window = pd.concat([window, feature_df[features].iloc[window.index.start:window.index.stop]], axis=1)
+        level = None
+        window_points = len(window)
+        total_points = session_arrays.total_rows
+
+    with span("session.downsample"):
+        plot_df = downsample(window, spec.time_column, spec.plot_columns[0], max_points, method)
+    logging.info(f"Plotting {len(plot_df)} of {len(window)} {f'{level} s buckets' if level else 'points'} "
+                 f"in window ({method})")
+
+    with span("session.figure"):
+        session_fig = session_figure(plot_df, metadata, participant, session, data_type, features,
+                                     band=level is not None)
+        if time_range is not None and None not in time_range:
+            session_fig.update_xaxes(range=list(time_range))
+    return session_fig, {
+        "points": len(plot_df),
+        "window_points": window_points,
+        "total_points": total_points,
+        "method": method,
+        "level": level,  # Pyramid bucket seconds, None when plotted from the samples
+    }
+
+@app.route("/api/session")
+def api_session():
+    """
+    Session figure between optional start/end timestamps, downsampled to at most max_points points.
+    The page requests the visible window again on every zoom or pan, so zooming in reaches full resolution.
+    sublevel=N shows sub-level N (from the session's metadata markers) instead of start/end.
+    features=bpm_sd,slope,... adds rolling heart-rate features precomputed by hrFeatures.py as extra lines.
+    The plotted columns and the default downsampling method come from the data type (dataTypes.py).
+    Zoomed-out views without features are drawn from the session's pyramid built by hrFix.py: the coarsest
+    level with a bucket for every pixel, plotted as bucket means over their min-max range.
+    """
+    data_type = request.args.get("data_type")
+    participant = request.args.get("participant")
+    session = request.args.get("session")
+    if session not in catalog.sessions(data_type, participant):
+        return error_response(f"Unknown session: {data_type}, {participant}, {session}", 404)
+    spec = get_data_type(data_type)
+    if spec is None:
+        return error_response("No session plot available for this data type.", 404)
+
+    method = request.args.get("method", spec.default_downsample)
+    if method not in METHODS:
+        return error_response(f"Unknown downsampling method: {method}", 400)
+    max_points = request.args.get("max_points", type=int) or max_points_for_width(DEFAULT_PLOT_WIDTH)
+    max_points = min(max(max_points, 10), MAX_POINTS_LIMIT)
+
+    features = [feature for feature in request.args.get("features", "").split(",") if feature]
+    unknown = [feature for feature in features if feature not in FEATURE_LABELS]
+    if unknown:
+        return error_response(f"Unknown features: {', '.join(unknown)}", 400)
+    if features and spec is not HEARTRATE:
+        return error_response("Rolling features are only computed for heartrate", 400)
+    feature_file = features_path(participant, session) if features else None
+    if features and not feature_file:
+        return error_response(f"No features computed for {participant}, {session}; run hrFeatures.py", 404)
+
+    start, end = request.args.get("start"), request.args.get("end")
+    sublevel = request.args.get("sublevel", type=int)
+    if sublevel is not None:
+        metadata_file = session_paths(participant, session, data_type)[1]
+        with span("load.metadata"):
+            bounds = sublevel_bounds(catalog.load(metadata_file) if metadata_file else None, sublevel)
+        if bounds is None:
+            return error_response(f"No sub-level {sublevel} in the metadata of {participant}, {session}", 404)
+        start, end = (str(bound) if bound is not None else None for bound in bounds)
+    try:
+        time_range = tuple(pd.Timestamp(bound) if bound else None for bound in (start, end)) if start or end else None
+    except ValueError as e:
+        return error_response(f"Invalid time range: {e}", 400)
+
+    # Downsampling to fewer points than pixels anyway, so bucket means over the whole pixel lose nothing
+    pyramid_file = session_pyramid_path(participant, session, data_type) if method != "none" and not features \
+        else None
+
+    with span("cache.lookup"):
+        paths = [path for path in session_paths(participant, session, data_type) + (feature_file, pyramid_file)
+                 if path]
+        key = figure_cache.key("session", data_type, participant, session, start, end, max_points, method,
+                               features, data_version(paths))
+        body = figure_cache.get(key)
+    if body is not None:
+        return json_response(body)
+
+    try:
+        session_fig, info = session_view(participant, session, spec, time_range, max_points, method, features,
+                                         feature_file, pyramid_file)
+    except SessionViewError as e:
+        return error_response(str(e), e.status)
+    with span("session.serialize"):
+        body = figure_body(session_fig, **info)
+    with span("cache.store"):
+        figure_cache.put(key, body)
+    return json_response(body)
+
+@app.route("/api/quality")
+def api_quality():
+    """
+    Data-quality table of one data type from hrQuality.py, one row per participant/session/sub-level, sorted
+    by sort=<column> (coverage by default, descending=1 to reverse) and limited to participant=P1 if given.
+    """
+    data_type = request.args.get("data_type", HEARTRATE.name)
+    sort = request.args.get("sort", DEFAULT_QUALITY_SORT)
+    if sort not in QUALITY_VIEW_COLUMNS:
+        return error_response(f"Unknown column: {sort}", 400)
+    rows = quality_view(data_type, sort, request.args.get("descending") == "1", request.args.get("participant"))
+    if rows is None:
+        return error_response(f"No quality table for {data_type}; run hrQuality.py --data-type {data_type}", 404)
+    rows = rows.assign(start=rows["start"].astype(str), end=rows["end"].astype(str))
+    return jsonify({"columns": QUALITY_VIEW_COLUMNS, "rows": records(rows)})
+
+@app.route("/api/cache")
+def api_cache():
+    """
+    Hit/miss counters and sizes of this worker's data cache and the shared figure cache, and the sessions
+    packed in the memory-mapped store.
+    """
+    return jsonify({
+        "figures": figure_cache.stats(),
+        "data": catalog.cache_info(),
+        "store": session_store.info(),
+        "reloads": watcher.updates,
+    })
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Request and span timings of this worker in the Prometheus text format, plus cache and memory gauges."""
+    figures = figure_cache.stats()
+    data = catalog.cache_info()
+    body = metrics.prometheus({
+        "mindmap_process_resident_memory_bytes": rss_bytes(),
+        "mindmap_data_cache_bytes": data["bytes"],
+        "mindmap_data_cache_entries": data["entries"],
+        "mindmap_data_cache_bytes_per_session_hour": data["bytes_per_session_hour"],
+        "mindmap_figure_cache_bytes": figures["bytes"],
+        "mindmap_figure_cache_hits": figures["hits"],
+        "mindmap_figure_cache_misses": figures["misses"],
+    })
+    return app.response_class(body, mimetype="text/plain; version=0.0.4")
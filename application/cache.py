@@ -0,0 +1,96 @@
+import hashlib
+import os
+import threading
+
+def data_version(paths):
+    """Version stamp of a set of files from their sizes and mtimes; changes whenever preprocessing rewrites one."""
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        except FileNotFoundError:
+            digest.update(f"{path}:missing;".encode())
+    return digest.hexdigest()
+
+class FigureCache:
+    """
+    Serialized figures stored as files in cache_dir, so every worker process shares them.
+
+    Entries are keyed by the selection and the data version, so changed data is never served stale; old
+    versions simply stop being used and age out. The directory is kept under max_bytes by deleting the
+    least recently used files (reads refresh a file's mtime). Hit and miss counters are per process.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._bytes = sum(size for _, _, size in self._entries())
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _entries(self):
+        """(mtime, path, size) of every cached file."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:  # Evicted by another worker
+                    continue
+                entries.append((stat.st_mtime_ns, path, stat.st_size))
+        return entries
+
+    def get(self, key):
+        """Cached payload for key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return payload
+
+    def put(self, key, payload):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._bytes += len(payload)
+            if self._bytes <= self.max_bytes:
+                return
+            # Other workers also write here, so recount from disk before evicting
+            entries = sorted(self._entries())
+            self._bytes = sum(size for _, _, size in entries)
+            for _, evicted_path, size in entries:
+                if self._bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(evicted_path)
+                except FileNotFoundError:
+                    pass
+                self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes": self._bytes, "max_bytes": self.max_bytes}
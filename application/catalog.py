@@ -0,0 +1,195 @@
+import os
+import threading
+from collections import OrderedDict
+
+from application.profiling import span
+from application.summary import file_signature
+from application.utils import index_watch_files, watch_file_key
+from hrCompact import SessionArrays
+from hrStore import read_frame, read_frame_window
+
+class DataCatalog:
+    """
+    Index of the processed files by data type, participant and session, over one or more base directories
+    (one per registered data type, see dataTypes.py).
+
+    Only file paths are collected up front. Files are read on first use and kept in an LRU cache
+    bounded by their in-memory size, so a worker never holds more than cache_bytes of data. Session files
+    are cached in compact form (see SessionArrays). Each entry is kept with the file's size and mtime and is
+    read again once those change, so a rewritten file is never served from the cache. Cached data is shared
+    between requests and must not be modified by callers.
+    """
+
+    def __init__(self, base_dirs, cache_bytes):
+        self.base_dirs = [base_dirs] if isinstance(base_dirs, str) else list(base_dirs)
+        self.cache_bytes = cache_bytes
+        self.index = {}
+        for base_dir in self.base_dirs:
+            for data_type, participants in index_watch_files(base_dir).items():
+                for participant, sessions in participants.items():
+                    for session, files in sessions.items():
+                        self.index.setdefault(data_type, {}).setdefault(participant, {}).setdefault(session, {}).update(files)
+
+        self._cache = OrderedDict()  # (kind, path) -> (data, size in bytes, hours of recording, file signature)
+        self._cache_size = 0
+        self._cache_hours = 0.0
+        self._lock = threading.Lock()
+
+    def data_types(self):
+        return list(self.index.keys())
+
+    def participants(self, data_type):
+        return list(self.index.get(data_type, {}).keys())
+
+    def sessions(self, data_type, participant):
+        return list(self.index.get(data_type, {}).get(participant, {}).keys())
+
+    def files(self, data_type, participant, session):
+        """Filename -> path of every file recorded for a session."""
+        return self.index.get(data_type, {}).get(participant, {}).get(session, {})
+
+    def paths(self, data_type):
+        """Every file of a data type, from one version of the index."""
+        return [path for sessions in self.index.get(data_type, {}).values()
+                for files in sessions.values() for path in files.values()]
+
+    def _hit(self, key, signature):
+        """Cached data of key if it was read from the file as it is now (signature), else None. Holds the lock."""
+        entry = self._cache.get(key)
+        if entry is None or entry[3] != signature:
+            return None
+        self._cache.move_to_end(key)
+        return entry[0]
+
+    def _drop(self, key):
+        """Remove an entry, if present. Holds the lock."""
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._cache_size -= entry[1]
+            self._cache_hours -= entry[2]
+
+    def _cached(self, key, read, measure):
+        signature = file_signature(key[1])
+        with self._lock:
+            data = self._hit(key, signature)
+        if data is not None:
+            return data
+
+        data = read()
+        size, hours = measure(data)
+        if size > self.cache_bytes:
+            return data
+
+        # A file rewritten while it was read (and maybe already evicted by update) isn't cached
+        try:
+            unchanged = file_signature(key[1]) == signature
+        except FileNotFoundError:
+            unchanged = False
+        with self._lock:
+            if unchanged and self._hit(key, signature) is None:
+                self._drop(key)
+                self._cache[key] = (data, size, hours, signature)
+                self._cache_size += size
+                self._cache_hours += hours
+            # Evict least recently used entries until the cache fits its budget again
+            while self._cache_size > self.cache_bytes:
+                self._drop(next(iter(self._cache)))
+        return data
+
+    def update(self, paths):
+        """
+        Apply files that were added, modified or removed. Only the affected sessions are re-indexed, in a copy
+        of the index that replaces it in one assignment, so a request sees the old or the new index and never a
+        mix. Cached data of the paths is dropped. Returns the (data type, participant, session) keys updated.
+        """
+        index = dict(self.index)
+        copied = set()
+        updated = set()
+
+        def own(parent, key):
+            # Copy each nested dict on the way to a changed file once; untouched branches stay shared
+            if key not in copied:
+                parent[key[-1]] = dict(parent.get(key[-1], {}))
+                copied.add(key)
+            return parent[key[-1]]
+
+        for path in paths:
+            if not any(path.startswith(os.path.join(base_dir, "")) for base_dir in self.base_dirs):
+                continue
+            key = watch_file_key(path)
+            if key is None:
+                continue
+            data_type, participant, session = key
+            participants = own(index, (data_type,))
+            sessions = own(participants, (data_type, participant))
+            files = own(sessions, key)
+            name = os.path.basename(path)
+            if os.path.exists(path):
+                files[name] = path
+            elif files.get(name) == path:
+                del files[name]
+            updated.add(key)
+
+        # Drop sessions, participants and data types left without files
+        for data_type, participant, session in updated:
+            participants = index.get(data_type, {})
+            sessions = participants.get(participant, {})
+            if session in sessions and not sessions[session]:
+                del sessions[session]
+            if participant in participants and not sessions:
+                del participants[participant]
+            if data_type in index and not participants:
+                del index[data_type]
+
+        self.index = index
+        with self._lock:
+            for path in paths:
+                for kind in ("frame", "session"):
+                    self._drop((kind, path))
+        return updated
+
+    def load(self, path):
+        """Return the DataFrame stored at path, reading it only if it isn't cached."""
+        def read():
+            with span("catalog.read"):
+                return read_frame(path)
+        return self._cached(("frame", path), read, lambda df: (int(df.memory_usage(deep=True).sum()), 0.0))
+
+    def load_session(self, path):
+        """Return the processed session stored at path as SessionArrays, reading it only if it isn't cached."""
+        def read():
+            with span("catalog.read"):
+                df = read_frame(path)
+            with span("catalog.compact"):
+                return SessionArrays.from_frame(df)
+        return self._cached(("session", path), read, lambda session: (session.nbytes, session.hours))
+
+    def load_session_window(self, path, start=None, end=None):
+        """
+        SessionArrays with at least the rows between start and end: the whole session if it is cached, otherwise
+        only the row groups covering the window, read without caching them. Reading a few minutes costs the
+        same however long the session is.
+        """
+        signature = file_signature(path)
+        with self._lock:
+            session = self._hit(("session", path), signature)
+        if session is not None:
+            return session
+        with span("catalog.read_window"):
+            df, first_row, total_rows = read_frame_window(path, start, end)
+        with span("catalog.compact"):
+            return SessionArrays.from_frame(df, first_row=first_row, total_rows=total_rows)
+
+    def cache_info(self):
+        """Entries and bytes in the cache, and bytes per hour of cached session recordings."""
+        with self._lock:
+            return {
+                "entries": len(self._cache),
+                "bytes": self._cache_size,
+                "budget": self.cache_bytes,
+                "session_hours": round(self._cache_hours, 3),
+                "bytes_per_session_hour": self._session_bytes() / self._cache_hours if self._cache_hours > 0 else None,
+            }
+
+    def _session_bytes(self):
+        return sum(size for (kind, _), (_, size, _, _) in self._cache.items() if kind == "session")
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+# Cohorts compared when the request names none: the ADHD and non-ADHD groups, by participant ID prefix
+DEFAULT_COHORTS = {"ADHD Participants (P#)": "P", "Non-ADHD Participants (N#)": "N"}
+
+# z value of the two-sided 95% confidence interval of a cohort mean (normal approximation)
+CI_Z = 1.959964
+
+COHORT_STAT_COLUMNS = ["cohort", "session", "n", "mean", "std", "median", "q1", "q3", "ci_low", "ci_high"]
+
+def session_numbers(sessions):
+    """Number at the end of each session name ('Session_12' -> 12), used to order sessions."""
+    names = pd.Series(pd.unique(sessions), dtype=object)
+    numbers = names.str.extract(r"(\d+)$", expand=False).astype("float64")
+    return sessions.map(dict(zip(names, numbers.to_numpy())))
+
+def cohort_members(participants, cohorts=None):
+    """
+    Long table of (cohort, participant) pairs. cohorts maps a cohort name to a list of participant IDs,
+    or to an ID prefix (a string) as in DEFAULT_COHORTS. A participant may be in several cohorts.
+    """
+    participants = pd.Series(sorted(set(participants)), dtype=object)
+    frames = []
+    for name, members in (cohorts or DEFAULT_COHORTS).items():
+        if isinstance(members, str):
+            selected = participants[participants.str.startswith(members)]
+        else:
+            selected = participants[participants.isin(members)]
+        frames.append(pd.DataFrame({"cohort": name, "participant": selected.to_numpy()}))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["cohort", "participant"])
+
+def cohort_table(summary, cohorts=None):
+    """
+    Tidy cohort/participant/session table of session means from a SummaryIndex table, ordered by cohort and
+    session number. Only the per-session summaries are used, never the data files.
+    """
+    sessions = summary.loc[summary["count"] > 0, ["participant", "session", "mean"]]
+    table = cohort_members(sessions["participant"], cohorts).merge(sessions, on="participant")
+    table["session_number"] = session_numbers(table["session"])
+    return table.sort_values(["cohort", "session_number", "participant"], kind="mergesort").reset_index(drop=True)
+
+def cohort_statistics(table):
+    """
+    Distribution of the participants' session means for every cohort and session: count, mean, standard
+    deviation, median, quartiles and the 95% confidence interval of the mean. One grouped pass over the table.
+    """
+    if table.empty:
+        return pd.DataFrame(columns=COHORT_STAT_COLUMNS)
+
+    grouped = table.groupby(["cohort", "session_number", "session"], sort=True)["mean"]
+    stats = grouped.agg(n="count", mean="mean", std="std", median="median")
+    quartiles = grouped.quantile([0.25, 0.75]).unstack()
+    stats["q1"] = quartiles[0.25]
+    stats["q3"] = quartiles[0.75]
+
+    half_width = CI_Z * stats["std"] / np.sqrt(stats["n"])
+    stats["ci_low"] = stats["mean"] - half_width
+    stats["ci_high"] = stats["mean"] + half_width
+    return stats.reset_index()[COHORT_STAT_COLUMNS]
+
+def participant_trajectories(table):
+    """Session means of each participant over sessions: one row per participant, one column per session."""
+    if table.empty:
+        return pd.DataFrame()
+    sessions = table.drop_duplicates("session").sort_values("session_number")["session"]
+    trajectories = table.drop_duplicates(["participant", "session"]).pivot(
+        index="participant", columns="session", values="mean")
+    return trajectories.reindex(columns=sessions)
+
+def records(df):
+    """DataFrame rows as JSON-ready dicts, with None in place of NaN."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
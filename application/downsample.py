@@ -0,0 +1,102 @@
+import numpy as np
+
+# Downsampling algorithms selectable in the session view ("none" plots every point)
+METHODS = ("lttb", "minmax", "none")
+DEFAULT_METHOD = "lttb"
+
+# Points sent to the browser per horizontal pixel of the plot
+POINTS_PER_PIXEL = 2
+DEFAULT_PLOT_WIDTH = 1200
+
+def max_points_for_width(plot_width):
+    """Number of points worth plotting on a plot of the given width in pixels."""
+    return max(int(plot_width), 100) * POINTS_PER_PIXEL
+
+def gap_starts(missing):
+    """Positions where a run of missing values (SR or ZERO seconds) begins."""
+    starts = missing.copy()
+    starts[1:] &= ~missing[:-1]
+    return np.flatnonzero(starts)
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: positions of n_out points that keep the visual shape of the series.
+    The first and last points are always kept; x and y must not contain NaN.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n_out - 2 buckets between the first and last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Keep the point forming the largest triangle with the last kept point and the next bucket's average
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+def minmax_indices(y, n_buckets):
+    """
+    Positions of the minimum and maximum of each of n_buckets equal-sized buckets, plus the first missing
+    value of any bucket that has one so gaps still break the line.
+    """
+    n = len(y)
+    bucket = np.arange(n) * n_buckets // n
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    missing = np.isnan(y)
+
+    def first_per_bucket(mask):
+        positions = np.flatnonzero(mask)
+        _, first = np.unique(bucket[positions], return_index=True)
+        return positions[first]
+
+    low = np.where(missing, np.inf, y)
+    high = np.where(missing, -np.inf, y)
+    lows = first_per_bucket(~missing & (low == np.minimum.reduceat(low, starts)[bucket]))
+    highs = first_per_bucket(~missing & (high == np.maximum.reduceat(high, starts)[bucket]))
+    return np.unique(np.concatenate([lows, highs, first_per_bucket(missing)]))
+
+def minmax_budget_indices(y, max_points):
+    """
+    minmax_indices with at most max_points positions. The gap points come on top of two points per bucket,
+    so the buckets are made fewer until the gap points fit in the budget too.
+    """
+    n_buckets = max(max_points // 2, 1)
+    while True:
+        indices = minmax_indices(y, n_buckets)
+        if len(indices) <= max_points or n_buckets == 1:
+            return indices[:max_points]
+        # Every bucket removed drops its min and max, so shrink by half the overshoot
+        n_buckets = max(n_buckets - (len(indices) - max_points + 1) // 2, 1)
+
+def downsample(df, x_column, y_column, max_points, method=DEFAULT_METHOD):
+    """
+    Reduce a time series to about max_points rows for plotting. Missing values are kept as line breaks, so
+    SR gaps and ZERO readings stay visible at any resolution.
+    """
+    if method == "none" or len(df) <= max_points:
+        return df
+
+    y = df[y_column].to_numpy(dtype="float64")
+    missing = np.isnan(y)
+    gaps = gap_starts(missing)
+
+    # LTTB marks every gap individually; when gaps are too dense for that, min/max buckets summarise them
+    if method == "minmax" or len(gaps) > max_points // 2:
+        return df.iloc[minmax_budget_indices(y, max_points)]
+
+    valid = np.flatnonzero(~missing)
+    x = df[x_column].astype("int64").to_numpy(dtype="float64")
+    keep = valid[lttb_indices(x[valid], y[valid], max_points - len(gaps))]
+    return df.iloc[np.union1d(keep, gaps)]
@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from application.summary import group_session_means
+from dataTypes import HEARTRATE, get_data_type
+from hrFeatures import FEATURE_LABELS
+
+def value_label(data_type):
+    """Axis label of a data type's values, e.g. BPM."""
+    spec = get_data_type(data_type)
+    return spec.value_label if spec is not None else data_type
+
+def overview_figure(summary, data_type):
+    """Mean of the session means for the P (ADHD) and N (non-ADHD) groups, from a SummaryIndex table."""
+    fig = go.Figure()
+
+    p_mean = group_session_means(summary, 'P')  # ADHD participants
+    if not p_mean.empty:
+        fig.add_trace(go.Scatter(
+            x=p_mean['session'],
+            y=p_mean['mean'],
+            name='ADHD Participants (P#)',
+            mode='lines+markers'
+        ))
+
+    n_mean = group_session_means(summary, 'N')  # Non-ADHD participants
+    if not n_mean.empty:
+        fig.add_trace(go.Scatter(
+            x=n_mean['session'],
+            y=n_mean['mean'],
+            name='Non-ADHD Participants (N#)',
+            mode='lines+markers'
+        ))
+
+    fig.update_layout(
+        title=f'Average {data_type} by Group',
+        xaxis_title='Session',
+        yaxis_title=f'Average {value_label(data_type)}',
+        hovermode='x unified'
+    )
+    return fig
+
+def cohort_figure(table, statistics, data_type):
+    """
+    Median session mean of each cohort with its interquartile range as a band, over thin lines of the
+    individual participants' trajectories. table and statistics come from application.cohort.
+    """
+    fig = go.Figure()
+    colors = px.colors.qualitative.Plotly
+    sessions = table.drop_duplicates("session").sort_values("session_number")["session"].tolist()
+
+    for i, (cohort, stats) in enumerate(statistics.groupby("cohort", sort=False)):
+        color = colors[i % len(colors)]
+
+        # All trajectories of the cohort in one trace, each participant's sessions in order, separated by gaps
+        members = table[table["cohort"] == cohort].sort_values(["participant", "session_number"], kind="mergesort")
+        participants = members["participant"].to_numpy(dtype=object)
+        breaks = np.flatnonzero(participants[1:] != participants[:-1]) + 1
+        fig.add_trace(go.Scatter(
+            x=np.insert(members["session"].to_numpy(dtype=object), breaks, None),
+            y=np.insert(members["mean"].to_numpy(dtype="float64"), breaks, np.nan),
+            text=np.insert(participants, breaks, None),
+            mode="lines",
+            line=dict(color=color, width=1),
+            opacity=0.25,
+            name=f"{cohort} participants",
+            legendgroup=cohort,
+            hovertemplate="%{text}: %{y:.1f}<extra></extra>",
+        ))
+
+        fig.add_trace(go.Scatter(
+            x=np.concatenate([stats["session"], stats["session"][::-1]]),
+            y=np.concatenate([stats["q3"], stats["q1"][::-1]]),
+            fill="toself",
+            fillcolor=color,
+            opacity=0.2,
+            line=dict(width=0),
+            name=f"{cohort} IQR",
+            legendgroup=cohort,
+            hoverinfo="skip",
+        ))
+        fig.add_trace(go.Scatter(
+            x=stats["session"],
+            y=stats["median"],
+            customdata=stats[["n", "q1", "q3"]],
+            mode="lines+markers",
+            line=dict(color=color, width=3),
+            name=f"{cohort} median",
+            legendgroup=cohort,
+            hovertemplate="%{y:.1f} (IQR %{customdata[1]:.1f}-%{customdata[2]:.1f}, n=%{customdata[0]})<extra></extra>",
+        ))
+
+    fig.update_layout(
+        title=f'{data_type} by Cohort',
+        xaxis_title='Session',
+        yaxis_title=f'Session Mean {value_label(data_type)}',
+        hovermode='x unified'
+    )
+    fig.update_xaxes(categoryorder="array", categoryarray=sessions)
+    return fig
+
+def marker_traces(metadata):
+    """
+    Metadata markers as one scatter trace per kind (10-minute mark in red, other markers such as sub-level
+    starts in green). Every marker is a dotted line from 0 to 1 on a hidden overlay axis, so it spans the
+    plot height, and NaN rows separate the lines. Built from arrays, so hundreds of markers stay cheap.
+    """
+    timestamps = pd.to_datetime(metadata['timestamp']).to_numpy()
+    labels = metadata['label'].astype(str)
+    ten_minute = labels.str.lower().str.contains("10-minute", regex=False).to_numpy()
+
+    traces = []
+    for name, color, mask in (("Sub-level start", "green", ~ten_minute), ("10-minute mark", "red", ten_minute)):
+        count = int(mask.sum())
+        if not count:
+            continue
+        traces.append(go.Scatter(
+            x=np.repeat(timestamps[mask], 3),
+            y=np.tile([0.0, 1.0, np.nan], count),
+            text=np.repeat(labels.to_numpy()[mask], 3),
+            mode="lines",
+            line=dict(color=color, dash="dot"),
+            name=name,
+            legendgroup=name,
+            yaxis="y2",
+            hovertemplate="%{text}<br>%{x}<extra></extra>",
+        ))
+    return traces
+
+def feature_traces(plot_df, features):
+    """
+    Rolling feature columns of plot_df as extra lines. The rolling mean shares the BPM axis; the other
+    features, on other scales, go on a right-hand axis (y3).
+    """
+    return [
+        go.Scatter(
+            x=plot_df["watch_timestamp"],
+            y=plot_df[feature],
+            mode="lines",
+            name=FEATURE_LABELS[feature],
+            yaxis="y" if feature == "bpm_mean" else "y3",
+        )
+        for feature in features
+    ]
+
+def range_band_traces(plot_df):
+    """
+    Shaded band between the min and max columns of pyramid buckets (see hrPyramid), drawn as an invisible
+    max line and a min line filled up to it, so the extremes averaged away by the bucket means stay visible.
+    """
+    return [
+        go.Scatter(x=plot_df["watch_timestamp"], y=plot_df["max"], mode="lines", line=dict(width=0),
+                   name="Max", legendgroup="range", showlegend=False, hoverinfo="skip"),
+        go.Scatter(x=plot_df["watch_timestamp"], y=plot_df["min"], mode="lines", line=dict(width=0),
+                   fill="tonexty", fillcolor="rgba(99, 110, 250, 0.2)", name="Min-max range",
+                   legendgroup="range", hoverinfo="skip"),
+    ]
+
+def session_figure(plot_df, metadata, participant, session, data_type, features=(), band=False):
+    """
+    Line plot of the data type's plot columns with a dotted marker for each metadata row (sub-level starts,
+    10-minute mark) and a line for each of the given rolling feature columns of plot_df (see hrFeatures).
+    With band, plot_df holds pyramid buckets and their min-max range is shaded behind the line of means.
+    """
+    plot_columns = list((get_data_type(data_type) or HEARTRATE).plot_columns)
+    session_fig = px.line(
+        plot_df,
+        x="watch_timestamp",
+        y=plot_columns if len(plot_columns) > 1 else plot_columns[0],
+        title=f"{participant} - {session} - {data_type} (Session View)"
+    )
+    session_fig.update_layout(
+        xaxis_title="Time",
+        yaxis_title=value_label(data_type)
+    )
+
+    if band:
+        session_fig.add_traces(range_band_traces(plot_df))
+        # Band behind the line
+        session_fig.data = session_fig.data[-2:] + session_fig.data[:-2]
+
+    if features:
+        session_fig.add_traces(feature_traces(plot_df, features))
+        if any(feature != "bpm_mean" for feature in features):
+            session_fig.update_layout(yaxis3=dict(overlaying="y", side="right", title="Feature", showgrid=False))
+
+    # Add Metadata Markers
+    if metadata is not None and not metadata.empty:
+        session_fig.add_traces(marker_traces(metadata))
+        session_fig.update_layout(yaxis2=dict(overlaying="y", range=[0, 1], visible=False, fixedrange=True))
+
+    return session_fig
@@ -0,0 +1,182 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import g, has_request_context, request
+
+# Upper bounds (seconds) of the histogram buckets used for request and span durations
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def rss_bytes():
+    """Resident memory of this process, or None where it can't be read (e.g. Windows)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class Histogram:
+    """Cumulative bucket counts, count and sum of observed values, as Prometheus expects them."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+def _labels(**labels):
+    """Prometheus label set, e.g. {endpoint="api_session",status="200"}."""
+    escaped = {key: str(value).replace("\\", "\\\\").replace('"', '\\"') for key, value in labels.items()}
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+class Metrics:
+    """
+    In-process timing counters: a duration histogram per named span and per endpoint, request counts by
+    status and the total change in resident memory per endpoint. Each worker process keeps its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = {}         # span name -> Histogram
+        self.requests = {}      # endpoint -> Histogram
+        self.statuses = {}      # (endpoint, status) -> count
+        self.memory_delta = {}  # endpoint -> bytes
+
+    def observe_span(self, name, seconds):
+        with self._lock:
+            self.spans.setdefault(name, Histogram()).observe(seconds)
+
+    def observe_request(self, endpoint, status, seconds, memory_delta=None):
+        with self._lock:
+            self.requests.setdefault(endpoint, Histogram()).observe(seconds)
+            self.statuses[endpoint, status] = self.statuses.get((endpoint, status), 0) + 1
+            if memory_delta is not None:
+                self.memory_delta[endpoint] = self.memory_delta.get(endpoint, 0) + memory_delta
+
+    @staticmethod
+    def _histogram_lines(metric, histograms, label):
+        lines = [f"# TYPE {metric} histogram"]
+        for key, histogram in sorted(histograms.items()):
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f"{metric}_bucket{_labels(**{label: key, 'le': bound})} {count}")
+            lines.append(f"{metric}_bucket{_labels(**{label: key, 'le': '+Inf'})} {histogram.count}")
+            lines.append(f"{metric}_sum{_labels(**{label: key})} {histogram.sum:.6f}")
+            lines.append(f"{metric}_count{_labels(**{label: key})} {histogram.count}")
+        return lines
+
+    def prometheus(self, gauges=None):
+        """All metrics in the Prometheus text exposition format. gauges maps extra metric names to values."""
+        with self._lock:
+            lines = self._histogram_lines("mindmap_request_duration_seconds", self.requests, "endpoint")
+            lines += self._histogram_lines("mindmap_span_duration_seconds", self.spans, "span")
+            lines.append("# TYPE mindmap_requests_total counter")
+            for (endpoint, status), count in sorted(self.statuses.items()):
+                lines.append(f"mindmap_requests_total{_labels(endpoint=endpoint, status=status)} {count}")
+            lines.append("# TYPE mindmap_request_memory_delta_bytes_total counter")
+            for endpoint, delta in sorted(self.memory_delta.items()):
+                lines.append(f"mindmap_request_memory_delta_bytes_total{_labels(endpoint=endpoint)} {delta}")
+
+        for name, value in (gauges or {}).items():
+            if value is not None:
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+@contextmanager
+def span(name):
+    """
+    Time the enclosed block as the named stage, e.g. with span("session.load"). The duration goes to the
+    process metrics and, during a request, to that request's span list for the profile dump.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe_span(name, seconds)
+        if has_request_context() and "profile_spans" in g:
+            g.profile_spans.append((name, start - g.request_start, seconds))
+
+def init_app(app):
+    """
+    Time every request of app. Requests carrying ?profile=1 also get a Server-Timing header and, when
+    PROFILE_DIR is set, a JSON dump of their spans in that directory.
+    """
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        g.request_rss = rss_bytes()
+        g.profile_spans = []
+
+    @app.after_request
+    def record_request(response):
+        if "request_start" not in g:
+            return response
+        seconds = time.perf_counter() - g.request_start
+        rss = rss_bytes()
+        memory_delta = rss - g.request_rss if rss is not None and g.request_rss is not None else None
+        endpoint = request.endpoint or "unmatched"
+        metrics.observe_request(endpoint, response.status_code, seconds, memory_delta)
+
+        if request.args.get("profile") == "1":
+            spans = g.profile_spans
+            response.headers["Server-Timing"] = ", ".join(
+                [f'{re.sub(r"[^A-Za-z0-9_.-]", "_", name)};dur={duration * 1000:.1f}' for name, _, duration in spans]
+                + [f"total;dur={seconds * 1000:.1f}"]
+            )
+            if app.config.get("PROFILE_DIR"):
+                dump_profile(app.config["PROFILE_DIR"], request.full_path, endpoint, response.status_code,
+                             seconds, memory_delta, spans)
+        return response
+
+def dump_profile(profile_dir, path, endpoint, status, seconds, memory_delta, spans):
+    """Write one request's total time, memory change and span timeline (offsets from the request start)."""
+    os.makedirs(profile_dir, exist_ok=True)
+    now = datetime.now()
+    file_path = os.path.join(profile_dir, f"{now:%Y%m%d-%H%M%S-%f}_{endpoint}.json")
+    with open(file_path, "w") as f:
+        json.dump({
+            "time": now.isoformat(),
+            "path": path,
+            "status": status,
+            "seconds": seconds,
+            "memory_delta_bytes": memory_delta,
+            "spans": [{"name": name, "offset": offset, "seconds": duration} for name, offset, duration in spans],
+        }, f, indent=1)
+    logging.info(f"Request profile written: {file_path}")
+
+def setup_logging(log_file_path, level):
+    """
+    Log to log_file_path at the given level. Records are handed to a queue and written by a background
+    thread, so requests don't wait on the file.
+    """
+    file_handler = logging.FileHandler(log_file_path)
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    return listener
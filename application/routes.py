@@ -1,220 +1,263 @@
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from flask import render_template, request
 from application import app
-from application.utils import load_watch_data, parse_filename
-import plotly.express as px
-import plotly.graph_objects as go
-import plotly.io as pio
-import pandas as pd
+from application.cache import FigureCache
+from application.catalog import DataCatalog
+from application.downsample import DEFAULT_METHOD, METHODS, POINTS_PER_PIXEL
+from application.profiling import setup_logging, span
+from application.summary import SummaryIndex
+from application.watcher import DataWatcher
+from dataTypes import DATA_TYPES, HEARTRATE, get_data_type
+from hrCompact import SessionStore
+from hrFeatures import features_dir
+from hrQuality import QUALITY_COLUMNS, quality_dir
+from hrStore import find_data_file
+from plotly.offline import get_plotlyjs_version
 
 # Set up logging
 log_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "debug_summary.log")
-logging.basicConfig(filename=log_file_path, level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+setup_logging(log_file_path, app.config["LOG_LEVEL"])
 
 # Define base directories
 current_dir = os.path.dirname(os.path.abspath(__file__))
-processed_heartrate_data_dir = os.path.abspath(os.path.join(current_dir, '..', 'Processed_heartrate_sublevel_data'))
-processed_heartrate_sessions_dir = os.path.abspath(os.path.join(current_dir, '..', 'Processed_heartrate_sessions_data'))
-heartrate_metadata_dir = os.path.abspath(os.path.join(current_dir, '..', 'heartrate_metadata'))
-data = load_watch_data(processed_heartrate_data_dir)
-
-def get_data_type_from_filename(filename):
-    _, data_type = parse_filename(filename)
-    return data_type
-
-def prepare_dataframe(df, data_type):
-    prepared_df = df.copy()
-    if data_type == 'heartrate':
-        prepared_df['Time'] = pd.to_datetime(prepared_df['watch_timestamp'])
-        prepared_df['Value'] = prepared_df['bpm']
+
+def data_dir(name):
+    """Absolute path of a data folder in the repository root, e.g. Processed_heartrate_sessions_data."""
+    return os.path.abspath(os.path.join(current_dir, '..', name))
+
+processed_heartrate_data_dir = data_dir(HEARTRATE.sublevel_dir)
+processed_heartrate_sessions_dir = data_dir(HEARTRATE.session_dir)
+heartrate_metadata_dir = data_dir(HEARTRATE.metadata_dir)
+heartrate_features_dir = data_dir(features_dir)
+# Every registered data type whose sub-level files are present is listed in the catalog
+catalog = DataCatalog([data_dir(data_type.sublevel_dir) for data_type in DATA_TYPES.values()],
+                      cache_bytes=app.config["DATA_CACHE_BYTES"])
+summary_index = SummaryIndex(catalog)
+# Sessions packed by hrCompact.py are mapped from the store instead of being read into each worker
+session_store = SessionStore(app.config["STORE_DIR"])
+figure_cache = FigureCache(app.config["FIGURE_CACHE_DIR"], max_bytes=app.config["FIGURE_CACHE_BYTES"])
+# File reads release the GIL, so files needed by the same request are read in parallel
+io_executor = ThreadPoolExecutor(max_workers=app.config["IO_THREADS"], thread_name_prefix="mindmap-io")
+
+def apply_data_changes(paths):
+    """Bring the catalog and summaries up to date with files changed by a preprocessing run."""
+    sessions = catalog.update(paths)
+    summary_index.forget(paths)
+    logging.info(f"Reloaded {len(paths)} changed files ({len(sessions)} sessions re-indexed)")
+
+# New and changed processed files are picked up while the app runs; figures are keyed by the data version,
+# so they are rebuilt on their own. The watcher starts with the first request, not when the module is imported.
+watcher = DataWatcher(
+    catalog.base_dirs
+    + [data_dir(path) for data_type in DATA_TYPES.values()
+       for path in (data_type.session_dir, data_type.metadata_dir, data_type.pyramid_dir)]
+    + [heartrate_features_dir, data_dir(quality_dir)],
+    apply_data_changes,
+    interval=app.config["WATCH_INTERVAL"],
+)
+
+@app.before_request
+def start_watcher():
+    watcher.start()
+
+@app.context_processor
+def plot_settings():
+    """Plotly.js build matching the installed plotly package, and the resolution the page asks for."""
+    return {
+        "plotlyjs_url": f"https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js",
+        "points_per_pixel": POINTS_PER_PIXEL,
+    }
+
+def session_paths(participant, session, data_type=HEARTRATE.name):
+    """Paths of the processed session file and its metadata file, None for a file that doesn't exist."""
+    spec = get_data_type(data_type)
+    if spec is None:
+        return None, None
+    session_file_path = os.path.join(
+        data_dir(spec.session_dir),
+        participant,
+        session  # Main session data file, in any storage format
+    )
+    metadata_file_path = os.path.join(
+        data_dir(spec.metadata_dir),
+        participant,
+        session,
+        f"{session}_metadata"  # Metadata file in subfolder
+    )
+    return find_data_file(session_file_path), find_data_file(metadata_file_path)
+
+def session_pyramid_path(participant, session, data_type=HEARTRATE.name):
+    """
+    Path of the session's level-of-detail pyramid written by hrFix.py, None if there is none or it is older
+    than the session file it was built from.
+    """
+    spec = get_data_type(data_type)
+    session_data_path = session_paths(participant, session, data_type)[0]
+    if spec is None or not session_data_path:
+        return None
+    path = find_data_file(os.path.join(data_dir(spec.pyramid_dir), participant, session))
+    if not path or os.path.getmtime(path) < os.path.getmtime(session_data_path):
+        return None
+    return path
+
+def features_path(participant, session):
+    """Path of the session's rolling feature file written by hrFeatures.py, None if it hasn't been computed."""
+    return find_data_file(os.path.join(heartrate_features_dir, participant, session))
+
+def load_session(participant, session, data_type=HEARTRATE.name, window=None):
+    """
+    Return the processed session as SessionArrays and its metadata markers (None if the session has no
+    metadata). The session is None if no processed session file exists. It is mapped from the session store
+    when packed there and up to date, otherwise it comes from the shared catalog cache. Given a (start, end)
+    window, a session that isn't cached is only read around the window. Files are read concurrently, so a
+    slow data directory costs one round of reads instead of two.
+    """
+    session_data_path, metadata_data_path = session_paths(participant, session, data_type)
+    if not session_data_path:
+        logging.error(f"Session file not found: {participant}, {session}")
+        return None, None
+    with span("load.store"):
+        session_arrays = session_store.session(data_type, f"{participant}/{session}", session_data_path)
+    session_future = None
+    if session_arrays is None and window is not None:
+        session_future = io_executor.submit(catalog.load_session_window, session_data_path, *window)
+    elif session_arrays is None:
+        session_future = io_executor.submit(catalog.load_session, session_data_path)
+
+    # Load Metadata
+    metadata_future = None
+    if metadata_data_path:
+        logging.info(f"Metadata file found: {metadata_data_path}")
+        metadata_future = io_executor.submit(catalog.load, metadata_data_path)
     else:
+        logging.warning(f"No metadata file found for session: {participant}, {session}")
+
+    # The spans time the wait in this request; the reads themselves are timed as catalog.read
+    if session_future is not None:
+        with span("load.session"):
+            session_arrays = session_future.result()
+    metadata = None
+    if metadata_future is not None:
+        with span("load.metadata"):
+            metadata = metadata_future.result()
+
+    return session_arrays, metadata
+
+# Columns of the quality table shown and sortable on the quality page; the rest identify the scanned file
+QUALITY_VIEW_COLUMNS = [column for column in QUALITY_COLUMNS if column not in ("path", "size", "mtime_ns")]
+DEFAULT_QUALITY_SORT = "coverage"
+
+def quality_view(data_type, sort=DEFAULT_QUALITY_SORT, descending=False, participant=None):
+    """
+    Rows of a data type's quality table written by hrQuality.py, sorted by one of QUALITY_VIEW_COLUMNS and
+    optionally limited to one participant. None if the table hasn't been built.
+    """
+    path = find_data_file(os.path.join(data_dir(quality_dir), data_type)) if data_type in DATA_TYPES else None
+    if not path:
         return None
-    return prepared_df
+    with span("load.quality"):
+        table = catalog.load(path)
+    if participant:
+        table = table[table["participant"] == participant]
+    return table[QUALITY_VIEW_COLUMNS].sort_values(sort, ascending=not descending, kind="mergesort",
+                                                   na_position="last")
+
+@app.route("/quality")
+def quality():
+    """Data-quality table of one data type, one row per sub-level, sorted by the clicked column."""
+    data_types = [data_type for data_type in DATA_TYPES
+                  if find_data_file(os.path.join(data_dir(quality_dir), data_type))]
+    selected_data_type = request.args.get("data_type")
+    if selected_data_type not in data_types:
+        selected_data_type = data_types[0] if data_types else None
+    sort = request.args.get("sort")
+    if sort not in QUALITY_VIEW_COLUMNS:
+        sort = DEFAULT_QUALITY_SORT
+    descending = request.args.get("descending") == "1"
+    participant = request.args.get("participant") or None
+
+    rows = quality_view(selected_data_type, sort, descending, participant) if selected_data_type else None
+    with span("quality.render"):
+        return render_template(
+            "quality.html",
+            data_types=data_types,
+            selected_data_type=selected_data_type,
+            columns=QUALITY_VIEW_COLUMNS,
+            rows=rows.to_dict(orient="records") if rows is not None else [],
+            sort=sort,
+            descending=descending,
+            participant=participant,
+        )
 
 @app.route("/", methods=["GET", "POST"])
 def index():
-    try:
-        logging.info("Flask app started processing request.")
-        overview_html = "No data available"  # Default initialization
-
-        if not data:
-            logging.warning("No data available in the processed_heartrate_data directory.")
-            return render_template(
-                "layout.html",
-                overview_plot=overview_html,
-                session_plot="No data available",
-                data_types=[],
-                participants=[],
-                sessions=[],
-                selected_data_type=None,
-                selected_participant=None,
-                selected_session=None,
-            )
-
-        # Data type selection
-        available_data_types = list(data.keys())
-        selected_data_type = request.form.get("data_type")
-        if not selected_data_type or selected_data_type not in data:
-            selected_data_type = available_data_types[0]
-
-        # Participant and session selection
-        available_participants = list(data[selected_data_type].keys())
-        selected_participant = request.form.get("participant")
-        if not selected_participant or selected_participant not in data[selected_data_type]:
-            selected_participant = available_participants[0]
-
-        available_sessions = list(data[selected_data_type][selected_participant].keys())
-        selected_session = request.form.get("session")
-        if not selected_session or selected_session not in data[selected_data_type][selected_participant]:
-            selected_session = available_sessions[0]
-
-        logging.info(f"Selected data type: {selected_data_type}")
-        logging.info(f"Selected participant: {selected_participant}")
-        logging.info(f"Selected session: {selected_session}")
-
-        # Overview Plot: Combine data for all participants and sessions
-        p_data = []  # ADHD participants
-        n_data = []  # Non-ADHD participants
-
-        for participant, sessions in data[selected_data_type].items():
-            for session, csv_files in sessions.items():
-                combined_df = pd.DataFrame()  # Combine all CSVs for a session
-                for csv_name, df in csv_files.items():
-                    file_data_type = get_data_type_from_filename(csv_name)
-                    if file_data_type == selected_data_type:
-                        prepared_df = prepare_dataframe(df, file_data_type)
-                        if prepared_df is not None:
-                            combined_df = pd.concat([combined_df, prepared_df])
-
-                if not combined_df.empty:
-                    mean_value = combined_df['Value'].mean()
-                    data_point = {
-                        'Participant': participant,
-                        'Session': session,
-                        'Value': mean_value
-                    }
-                    if participant.startswith('P'):
-                        p_data.append(data_point)
-                    elif participant.startswith('N'):
-                        n_data.append(data_point)
-
-        # Generate overview plot
-        fig = go.Figure()
-
-        #Function: Sort session names like 'Session_1', 'Session_2', ..., 'Session_13' numerically.
-        def sort_sessions(session_names):
-      
-            return sorted(session_names, key=lambda x: int(x.split('_')[1]))
-
-        if p_data:
-            p_df = pd.DataFrame(p_data)
-            p_df['Session'] = pd.Categorical(
-                p_df['Session'], categories=sort_sessions(p_df['Session'].unique()), ordered=True
-            )
-            p_mean = p_df.groupby('Session')['Value'].mean().reset_index()
-            fig.add_trace(go.Scatter(
-                x=p_mean['Session'],
-                y=p_mean['Value'],
-                name='ADHD Participants (P#)',
-                mode='lines+markers'
-            ))
-
-        if n_data:
-            n_df = pd.DataFrame(n_data)
-            n_df['Session'] = pd.Categorical(
-                n_df['Session'], categories=sort_sessions(n_df['Session'].unique()), ordered=True
-            )
-            n_mean = n_df.groupby('Session')['Value'].mean().reset_index()
-            fig.add_trace(go.Scatter(
-                x=n_mean['Session'],
-                y=n_mean['Value'],
-                name='Non-ADHD Participants (N#)',
-                mode='lines+markers'
-            ))
-
-        fig.update_layout(
-            title=f'Average {selected_data_type} by Group',
-            xaxis_title='Session',
-            yaxis_title='Average BPM',
-            hovermode='x unified'
+    """
+    Render the selection dropdowns. The plots are fetched by the page from the JSON API (application/api.py),
+    so changing the session doesn't recompute the overview.
+    """
+    logging.info("Flask app started processing request.")
+
+    selected_downsample = request.values.get("downsample")
+
+    # One version of the index for the whole request; the watcher may replace catalog.index meanwhile
+    index = catalog.index
+    available_data_types = list(index)
+    if not available_data_types:
+        return no_data_page(selected_downsample)
+
+    # Data type selection
+    selected_data_type = request.values.get("data_type")
+    if not selected_data_type or selected_data_type not in available_data_types:
+        selected_data_type = available_data_types[0]
+    if selected_downsample not in METHODS:
+        spec = get_data_type(selected_data_type)
+        selected_downsample = spec.default_downsample if spec is not None else DEFAULT_METHOD
+
+    # Participant and session selection
+    available_participants = list(index[selected_data_type])
+    if not available_participants:
+        return no_data_page(selected_downsample)
+    selected_participant = request.values.get("participant")
+    if not selected_participant or selected_participant not in available_participants:
+        selected_participant = available_participants[0]
+
+    available_sessions = list(index[selected_data_type][selected_participant])
+    if not available_sessions:
+        return no_data_page(selected_downsample)
+    selected_session = request.values.get("session")
+    if not selected_session or selected_session not in available_sessions:
+        selected_session = available_sessions[0]
+
+    logging.info(f"Selected data type: {selected_data_type}")
+    logging.info(f"Selected participant: {selected_participant}")
+    logging.info(f"Selected session: {selected_session}")
+
+    with span("index.render"):
+        return render_template(
+            "layout.html",
+            data_types=available_data_types,
+            participants=available_participants,
+            sessions=available_sessions,
+            selected_data_type=selected_data_type,
+            selected_participant=selected_participant,
+            selected_session=selected_session,
+            downsample_methods=METHODS,
+            selected_downsample=selected_downsample,
         )
-        overview_html = pio.to_html(fig, full_html=False, include_plotlyjs='cdn')
-
-
-        # Session-Specific Plot (Bottom Graph)
-        session_html = ""
-        if selected_data_type == 'heartrate':
-            session_file_path = os.path.join(
-                processed_heartrate_sessions_dir,
-                selected_participant,
-                f"{selected_session}.csv"  # Main session data file
-            )
-            logging.info(f"Looking for session file: {session_file_path}")
-
-            if os.path.exists(session_file_path):
-                session_combined_df = pd.read_csv(session_file_path)
-                session_combined_df['Time'] = pd.to_datetime(session_combined_df['watch_timestamp'])
-
-                # Load Metadata
-                metadata_file_path = os.path.join(
-                    heartrate_metadata_dir,
-                    selected_participant,
-                    selected_session,
-                    f"{selected_session}_metadata.csv"  # Metadata file in subfolder
-                )
-                metadata = pd.DataFrame()
-                if os.path.exists(metadata_file_path):
-                    logging.info(f"Metadata file found: {metadata_file_path}")
-                    metadata = pd.read_csv(metadata_file_path)
-                    metadata['Time'] = pd.to_datetime(metadata['timestamp'])
-                else:
-                    logging.warning(f"No metadata file found for session: {metadata_file_path}")
-
-                # Create the graph
-                session_fig = px.line(
-                    session_combined_df,
-                    x="Time",
-                    y="bpm",
-                    title=f"{selected_participant} - {selected_session} - {selected_data_type} (Session View)"
-                )
-                session_fig.update_layout(
-                    xaxis_title="Time",
-                    yaxis_title="BPM"
-                )
-
-                # Add Metadata Markers
-                if not metadata.empty:
-                    for _, row in metadata.iterrows():
-                        line_color = "red" if "10-minute" in row['label'].lower() else "green"
-                        session_fig.add_vline(
-                            x=row['Time'],
-                            line=dict(color=line_color, dash="dot"),
-                            name=row['label']  # Only shows in legend
-                        )
-
-                session_html = pio.to_html(session_fig, full_html=False, include_plotlyjs='cdn')
-            else:
-                logging.error(f"Session file not found: {session_file_path}")
-                session_html = f"No processed session data found for {selected_participant}, {selected_session}"
-        else:
-            session_html = "No session plot available for this data type."
-
-    except Exception as e:
-        import traceback
-        logging.error(f"Error encountered: {str(e)}")
-        logging.debug(traceback.format_exc())
-        overview_html = f"Error generating overview plot: {str(e)}"
-        session_html = f"Error generating session plot: {str(e)}"
 
+def no_data_page(selected_downsample):
+    """The page without dropdowns, shown while no processed data is indexed."""
+    logging.warning("No data available in the processed sub-level data directories.")
     return render_template(
         "layout.html",
-        overview_plot=overview_html,
-        session_plot=session_html,
-        data_types=available_data_types,
-        participants=available_participants,
-        sessions=available_sessions,
-        selected_data_type=selected_data_type,
-        selected_participant=selected_participant,
-        selected_session=selected_session,
+        data_types=[],
+        participants=[],
+        sessions=[],
+        selected_data_type=None,
+        selected_participant=None,
+        selected_session=None,
+        downsample_methods=METHODS,
+        selected_downsample=selected_downsample if selected_downsample in METHODS else DEFAULT_METHOD,
     )
@@ -0,0 +1,102 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+from dataTypes import DATA_TYPES
+from hrStore import read_frame
+
+# Column summarised for each data type
+VALUE_COLUMNS = {name: data_type.summary_column for name, data_type in DATA_TYPES.items()}
+
+SUMMARY_COLUMNS = [
+    "participant", "session", "files", "rows", "count", "sum", "sumsq",
+    "mean", "min", "max", "var", "sr_errors", "zero_errors",
+]
+
+def summarize_frame(df, value_column):
+    """Additive statistics of one file: they can be combined across the files of a session without the raw data."""
+    values = df[value_column].to_numpy(dtype="float64")
+    valid = values[~np.isnan(values)]
+    errors = df["DATA ERROR"] if "DATA ERROR" in df else pd.Series(dtype=object)
+    return {
+        "rows": len(df),
+        "count": len(valid),
+        "sum": float(valid.sum()),
+        "sumsq": float(np.square(valid).sum()),
+        "min": float(valid.min()) if len(valid) else np.nan,
+        "max": float(valid.max()) if len(valid) else np.nan,
+        "sr_errors": int((errors == "SR").sum()),
+        "zero_errors": int((errors == "ZERO").sum()),
+    }
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+class SummaryIndex:
+    """
+    Per participant/session statistics for each data type, used for the overview plot.
+
+    Each file is read once; its statistics are kept with the file's size and mtime and recomputed only
+    when those change, so building a table after the first request costs one stat per file.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self._file_stats = {}  # path -> (signature, statistics)
+        self._lock = threading.Lock()
+
+    def file_stats(self, path, value_column):
+        signature = file_signature(path)
+        with self._lock:
+            cached = self._file_stats.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        stats = summarize_frame(read_frame(path), value_column)
+        with self._lock:
+            self._file_stats[path] = (signature, stats)
+        return stats
+
+    def forget(self, paths):
+        """Drop the statistics of files that changed or were removed."""
+        with self._lock:
+            for path in paths:
+                self._file_stats.pop(path, None)
+
+    def table(self, data_type):
+        """One row per participant/session with count, sum, mean, min, max, variance and error counts."""
+        value_column = VALUE_COLUMNS.get(data_type)
+        rows = []
+        if value_column is not None:
+            for participant, sessions in self.catalog.index.get(data_type, {}).items():
+                for session, files in sessions.items():
+                    file_stats = [self.file_stats(path, value_column) for path in files.values()]
+                    if not file_stats:
+                        continue
+                    row = {key: sum(stats[key] for stats in file_stats)
+                           for key in ("rows", "count", "sum", "sumsq", "sr_errors", "zero_errors")}
+                    row.update(participant=participant, session=session, files=len(file_stats),
+                               min=np.nanmin([stats["min"] for stats in file_stats] + [np.inf]),
+                               max=np.nanmax([stats["max"] for stats in file_stats] + [-np.inf]))
+                    rows.append(row)
+
+        table = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+        count = table["count"].astype("float64")
+        table["mean"] = table["sum"] / count.where(count > 0)
+        table["var"] = (table["sumsq"] - table["sum"] * table["mean"]) / (count - 1).where(count > 1)
+        table[["min", "max"]] = table[["min", "max"]].replace([np.inf, -np.inf], np.nan)
+        return table
+
+def sort_sessions(session_names):
+    """Sort session names like 'Session_1', 'Session_2', ..., 'Session_13' numerically."""
+    return sorted(session_names, key=lambda x: int(x.split('_')[1]))
+
+def group_session_means(table, prefix):
+    """Mean of the session means of every participant whose ID starts with prefix, ordered by session."""
+    group = table[table["participant"].str.startswith(prefix)]
+    if group.empty:
+        return group[["session", "mean"]]
+    sessions = pd.Categorical(group["session"], categories=sort_sessions(group["session"].unique()), ordered=True)
+    return group["mean"].groupby(sessions, observed=True).mean().rename_axis("session").reset_index()
@@ -1,9 +1,9 @@
 import os
-import pandas as pd
+from hrStore import is_data_file, read_frame
 
 def parse_filename(filename):
     """Parse the filename to extract participant and data type."""
-    parts = filename.replace('.csv', '').split('_')
+    parts = os.path.splitext(filename)[0].split('_')
     if len(parts) < 4:  # Adjusted as session is no longer extracted
         return None, None  # Invalid filename format
 
@@ -11,39 +11,56 @@ def parse_filename(filename):
     data_type = parts[-1]   # Last part: Data type (e.g., heartrate)
     return participant, data_type
 
-def load_watch_data(base_dir):
-    """Traverse the directory structure and load data into a nested dictionary based on folder structure."""
-    data = {}
+def watch_file_key(path):
+    """(data type, participant, session) of a processed sub-level file, or None if it isn't one."""
+    # Extract session number from folder name
+    session = os.path.basename(os.path.dirname(path))
+    if not session.startswith("S") or not is_data_file(path):  # Assuming session folders start with 'S'
+        return None
+    participant, data_type = parse_filename(os.path.basename(path))
+    if not participant or not data_type:
+        return None
+    return data_type, participant, session
+
+def index_watch_files(base_dir):
+    """Traverse the directory structure and index file paths into a nested dictionary based on folder structure."""
+    index = {}
 
     for root, _, files in os.walk(base_dir):
-        # Extract session number from folder name
-        session = os.path.basename(root)
-        if not session.startswith("S"):  # Assuming session folders start with 'S'
+        if not os.path.basename(root).startswith("S"):
             continue
 
         for csv_file in files:
-            if not csv_file.endswith('.csv'):
+            if not is_data_file(csv_file):
                 continue
 
-            csv_path = os.path.join(root, csv_file)
-            participant, data_type = parse_filename(csv_file)
-            if not participant or not data_type:
+            key = watch_file_key(os.path.join(root, csv_file))
+            if key is None:
                 print(f"Skipping invalid file: {csv_file}")
                 continue
 
             # Initialize nested structure for data
-            if data_type not in data:
-                data[data_type] = {}
-            if participant not in data[data_type]:
-                data[data_type][participant] = {}
-            if session not in data[data_type][participant]:
-                data[data_type][participant][session] = {}
-
-            # Load CSV into the structure
-            try:
-                print(f"Loading file: {csv_file} (Participant: {participant}, Session: {session}, Type: {data_type})")
-                data[data_type][participant][session][csv_file] = pd.read_csv(csv_path)
-            except Exception as e:
-                print(f"Error loading file {csv_file}: {e}")
+            data_type, participant, session = key
+            sessions = index.setdefault(data_type, {}).setdefault(participant, {})
+            sessions.setdefault(session, {})[csv_file] = os.path.join(root, csv_file)
+
+    return index
+
+def load_watch_data(base_dir):
+    """Traverse the directory structure and load data into a nested dictionary based on folder structure."""
+    data = {}
+
+    for data_type, participants in index_watch_files(base_dir).items():
+        for participant, sessions in participants.items():
+            for session, files in sessions.items():
+                data.setdefault(data_type, {}).setdefault(participant, {})[session] = {}
+
+                for csv_file, csv_path in files.items():
+                    # Load CSV into the structure
+                    try:
+                        print(f"Loading file: {csv_file} (Participant: {participant}, Session: {session}, Type: {data_type})")
+                        data[data_type][participant][session][csv_file] = read_frame(csv_path)
+                    except Exception as e:
+                        print(f"Error loading file {csv_file}: {e}")
 
     return data
@@ -0,0 +1,74 @@
+import logging
+import os
+import threading
+import time
+
+from hrStore import is_data_file
+
+def scan_data_files(directories):
+    """(size, mtime) of every data file under the directories that exist."""
+    signatures = {}
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for file in files:
+                if not is_data_file(file):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:  # Removed while scanning; the next scan sees it gone
+                    continue
+                signatures[path] = (stat.st_size, stat.st_mtime_ns)
+    return signatures
+
+class DataWatcher:
+    """
+    Poll directories of processed data every interval seconds and call on_change with the paths that were
+    added, modified or removed. Changes are collected until the directories have been stable for debounce
+    seconds, so a preprocessing run writing many files triggers one update after it finishes.
+
+    The baseline is scanned when the watcher is created; the polling thread is started by start(), which
+    does nothing when called again or when interval is 0.
+    """
+
+    def __init__(self, directories, on_change, interval=5.0, debounce=2.0):
+        self.directories = list(directories)
+        self.on_change = on_change
+        self.interval = interval
+        self.debounce = debounce
+        self.updates = 0
+        self._signatures = scan_data_files(self.directories) if interval > 0 else {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mindmap-watcher", daemon=True)
+                self._thread.start()
+
+    def poll(self, pending):
+        """Scan once and add the paths that differ from the previous scan to pending. True if any did."""
+        signatures = scan_data_files(self.directories)
+        changed = {path for path in signatures.keys() | self._signatures.keys()
+                   if signatures.get(path) != self._signatures.get(path)}
+        self._signatures = signatures
+        pending.update(changed)
+        return bool(changed)
+
+    def _run(self):
+        pending = set()
+        last_change = 0.0
+        while True:
+            time.sleep(self.interval)
+            try:
+                if self.poll(pending):
+                    last_change = time.monotonic()
+                elif pending and time.monotonic() - last_change >= self.debounce:
+                    changed, pending = pending, set()
+                    self.on_change(changed)
+                    self.updates += 1
+            except Exception:
+                logging.exception("Data watcher update failed")
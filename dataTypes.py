@@ -0,0 +1,85 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Registry of the watch data streams. Each descriptor says where a stream's files live, which columns it has,
+# how often it is sampled and how it is gap-filled, summarised and plotted, so preprocessing (hrFix.py, hrMeta.py)
+# and the app handle every type the same way. Adding a stream means adding an entry to DATA_TYPES.
+
+class DataType:
+    """
+    One data stream, e.g. heartrate.
+
+    value_columns are the measured columns of the raw CSVs (besides watch_timestamp) and are stored as float32.
+    sample_rate (Hz) sets the gap-fill period: every missing sample is inserted as an SR row.
+    A reading of 0 in one of zero_error_columns is a ZERO error and is blanked.
+    derived_columns maps extra columns to functions of the gap-filled frame, computed during preprocessing.
+    summary_column is aggregated for the overview and cohort views; plot_columns are drawn in the session view.
+    Readings of the summary column outside plausible_range (low, high) are flagged by hrQuality.py.
+    """
+
+    def __init__(self, name, value_columns, sample_rate=1, zero_error_columns=(), derived_columns=None,
+                 summary_column=None, plot_columns=None, default_downsample="lttb", value_label=None,
+                 plausible_range=None):
+        self.name = name
+        self.time_column = "watch_timestamp"
+        self.value_columns = tuple(value_columns)
+        self.sample_rate = sample_rate
+        self.period = pd.Timedelta(seconds=1 / sample_rate)
+        self.zero_error_columns = tuple(zero_error_columns)
+        self.derived_columns = dict(derived_columns or {})
+        self.summary_column = summary_column or self.value_columns[0]
+        self.plot_columns = tuple(plot_columns or (self.summary_column,))
+        self.default_downsample = default_downsample
+        self.value_label = value_label or self.summary_column
+        self.plausible_range = plausible_range
+
+        # Folder layout, the same for every type
+        self.raw_dir = os.path.join("Watch_data_org", f"{name}_data")
+        self.sublevel_dir = f"Processed_{name}_sublevel_data"
+        self.session_dir = f"Processed_{name}_sessions_data"
+        self.metadata_dir = f"{name}_metadata"
+        self.pyramid_dir = f"Processed_{name}_pyramid"
+
+    @property
+    def stored_columns(self):
+        """Value columns written to the processed files, measured and derived."""
+        return self.value_columns + tuple(self.derived_columns)
+
+    def has_columns(self, columns):
+        """True if a raw file with these columns belongs to this type."""
+        return self.time_column in columns and all(column in columns for column in self.value_columns)
+
+    def add_derived_columns(self, df):
+        """Frame with the derived columns added (NaN where an input is missing)."""
+        if not self.derived_columns:
+            return df
+        return df.assign(**{column: function(df) for column, function in self.derived_columns.items()})
+
+    def manifest_path(self, script):
+        """Manifest of a preprocessing script for this type; heartrate keeps the original file names."""
+        return f"{script}_manifest.json" if self.name == "heartrate" else f"{script}_{self.name}_manifest.json"
+
+def acceleration_magnitude(df):
+    """Length of the acceleration vector, for summaries and plots independent of the watch orientation."""
+    return np.sqrt(df["x"] ** 2 + df["y"] ** 2 + df["z"] ** 2)
+
+HEARTRATE = DataType(
+    "heartrate", ["bpm"], sample_rate=1, zero_error_columns=["bpm"], value_label="BPM", plausible_range=(30, 220),
+)
+
+# 50 Hz x/y/z acceleration. Min/max downsampling keeps the short peaks that LTTB can smooth away.
+ACCELEROMETER = DataType(
+    "accelerometer", ["x", "y", "z"], sample_rate=50, derived_columns={"magnitude": acceleration_magnitude},
+    summary_column="magnitude", default_downsample="minmax", value_label="Acceleration",
+)
+
+DATA_TYPES = {data_type.name: data_type for data_type in (HEARTRATE, ACCELEROMETER)}
+
+def get_data_type(name):
+    """Descriptor of a data type, or None if it isn't registered."""
+    return DATA_TYPES.get(name)
+
+def compact_columns():
+    """Every stored value column of every type, kept as float32 in columnar files."""
+    return {column for data_type in DATA_TYPES.values() for column in data_type.stored_columns}
@@ -0,0 +1,196 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import hrFix
+import hrMeta
+from dataTypes import HEARTRATE
+from hrSynth import generate_watch_tree, synth_recording
+
+# Benchmark the preprocessing and app stages on a synthetic Watch_data_org tree, store the timings and
+# compare them with an earlier run to catch performance regressions before deploying.
+
+results_dir = "bench_results"
+
+def measure(run, setup=None, repeat=3):
+    """
+    Time run(state) repeat times on fresh state from setup(), then once more under tracemalloc for the
+    peak Python/NumPy allocation (memory held by pyarrow isn't traced). Returns best and median seconds
+    and the peak in MB.
+    """
+    timings = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        run(state)
+        timings.append(time.perf_counter() - start)
+
+    state = setup() if setup else None
+    tracemalloc.start()
+    try:
+        run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": min(timings), "median_seconds": statistics.median(timings), "peak_mb": peak / 2 ** 20}
+
+def quietly(func, *args):
+    """Call func without its progress prints."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+def run_benchmarks(work_dir, params, stages=None):
+    """Generate the synthetic tree in work_dir and measure every stage (or only the named ones)."""
+    raw_dir = os.path.join(work_dir, HEARTRATE.raw_dir)
+    sublevel_dir = os.path.join(work_dir, HEARTRATE.sublevel_dir)
+    session_dir = os.path.join(work_dir, HEARTRATE.session_dir)
+    metadata_dir = os.path.join(work_dir, HEARTRATE.metadata_dir)
+    generate_watch_tree(work_dir, params["participants"], params["sessions"], params["sublevels"],
+                        params["duration"], params["dropout_rate"], params["zero_rate"], params["seed"])
+
+    # The app modules read their settings at import; keep their cache inside the work directory
+    os.environ["MINDMAP_FIGURE_CACHE_DIR"] = os.path.join(work_dir, "figure_cache")
+    import plotly.io as pio
+    from application.catalog import DataCatalog
+    from application.downsample import downsample, max_points_for_width, DEFAULT_PLOT_WIDTH
+    from application.plots import overview_figure, session_figure
+    from application.summary import SummaryIndex
+    from application.utils import load_watch_data
+
+    # One long session, as the gap-fill and session plot stages see it after parsing
+    rng = np.random.default_rng(params["seed"])
+    long_raw = synth_recording("2024-01-01 09:00:00", int(params["session_hours"] * 3600), rng,
+                               params["dropout_rate"], params["zero_rate"])
+    long_raw["watch_timestamp"] = pd.to_datetime(long_raw["watch_timestamp"])
+    long_session = hrFix.add_missing_seconds(long_raw)
+    repeat = params["repeat"]
+
+    def fresh_outputs():
+        for path in (sublevel_dir, session_dir, metadata_dir):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def ingest(_):
+        failed = hrFix.process_all_data(raw_dir, sublevel_dir, session_dir, workers=params["workers"],
+                                        fmt=params["format"], metadata_dir=metadata_dir)
+        if failed:
+            raise RuntimeError(f"Ingest failed for {failed}")
+
+    def overview_setup():
+        summary_index = SummaryIndex(DataCatalog(sublevel_dir, cache_bytes=2 ** 30))
+        summary_index.table("heartrate")
+        return summary_index
+
+    benchmarks = {
+        "gap_fill": (lambda _: hrFix.add_missing_seconds(long_raw), None),
+        "ingest": (ingest, fresh_outputs),
+        "metadata": (lambda _: hrMeta.process_all_sessions(raw_dir, metadata_dir, fmt=params["format"]), None),
+        "load_eager": (lambda _: quietly(load_watch_data, sublevel_dir), None),
+        "catalog_index": (lambda _: DataCatalog(sublevel_dir, cache_bytes=2 ** 30), None),
+        "summary_cold": (lambda index: index.table("heartrate"),
+                         lambda: SummaryIndex(DataCatalog(sublevel_dir, cache_bytes=2 ** 30))),
+        "overview_warm": (lambda index: overview_figure(index.table("heartrate"), "heartrate"), overview_setup),
+        "render_overview": (lambda index: pio.to_html(overview_figure(index.table("heartrate"), "heartrate"),
+                                                      full_html=False, include_plotlyjs="cdn"), overview_setup),
+        "render_session_full": (lambda _: session_figure(long_session, None, "P1", "Session_1", "heartrate").to_json(),
+                                None),
+        "render_session_downsampled": (lambda _: session_figure(
+            downsample(long_session, "watch_timestamp", "bpm", max_points_for_width(DEFAULT_PLOT_WIDTH)),
+            None, "P1", "Session_1", "heartrate").to_json(), None),
+    }
+
+    # Later stages read the ingest outputs, so make sure they exist even if ingest isn't benchmarked
+    fresh_outputs()
+    ingest(None)
+
+    results = {}
+    for name, (run, setup) in benchmarks.items():
+        if stages and name not in stages:
+            continue
+        results[name] = measure(run, setup, repeat)
+        print(f"{name:28s} {results[name]['seconds'] * 1000:10.1f} ms  peak {results[name]['peak_mb']:8.1f} MB")
+    return results
+
+def compare(results, baseline, threshold, min_seconds=0.005):
+    """Stages more than threshold (a fraction) slower than in the baseline, ignoring differences below min_seconds."""
+    regressions = []
+    for name, stage in results.items():
+        before = baseline.get("stages", {}).get(name)
+        if before is None:
+            continue
+        if stage["seconds"] > before["seconds"] * (1 + threshold) and stage["seconds"] - before["seconds"] > min_seconds:
+            regressions.append((name, before["seconds"], stage["seconds"]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingest, load and render stages on synthetic watch data.")
+    parser.add_argument("--participants", type=int, default=8)
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--sublevels", type=int, default=3)
+    parser.add_argument("--duration", type=int, default=900, help="Seconds per sub-level")
+    parser.add_argument("--session-hours", type=float, default=10, help="Length of the long session for gap fill and plots")
+    parser.add_argument("--dropout-rate", type=float, default=0.02)
+    parser.add_argument("--zero-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="hrFix workers for the ingest stage")
+    parser.add_argument("--format", choices=hrFix.FORMATS, default=hrFix.DEFAULT_FORMAT)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", nargs="*", help="Only run these stages")
+    parser.add_argument("--output", help=f"Results file (default: a timestamped file in {results_dir})")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before failing, e.g. 0.2 = 20%%")
+    args = parser.parse_args(argv)
+
+    params = {key: getattr(args, key) for key in (
+        "participants", "sessions", "sublevels", "duration", "session_hours", "dropout_rate", "zero_rate",
+        "seed", "workers", "format", "repeat")}
+
+    with tempfile.TemporaryDirectory(prefix="hrbench_") as work_dir:
+        stages = run_benchmarks(work_dir, params, args.stages)
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "params": params,
+        "environment": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "stages": stages,
+    }
+    output = args.output or os.path.join(results_dir, f"bench_{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"Results saved: {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("params") != params:
+            print("Warning: baseline was run with different parameters")
+        regressions = compare(stages, baseline, args.threshold)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms")
+        if regressions:
+            return 1
+        print("No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
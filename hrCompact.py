@@ -0,0 +1,369 @@
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+import numpy as np
+import pandas as pd
+
+from dataTypes import DATA_TYPES, compact_columns
+from hrStore import is_data_file, read_frame
+
+# Compact sessions, in memory (SessionArrays) and packed into a memory-mapped store shared by every web worker:
+# session_store/<data type>/index.json    where each session's rows are in the arrays, and how they are encoded
+# session_store/<data type>/<array>.npy   the arrays of every session, one after the other
+
+store_dir = "session_store"
+STORE_VERSION = 1
+
+logger = logging.getLogger("hrCompact")
+
+NS_PER_MS = 1_000_000
+NS_PER_HOUR = 3_600_000_000_000
+
+class SessionArrays:
+    """
+    Compact in-memory copy of a processed, time-sorted session, as kept in the data cache.
+
+    Timestamps are implicit (start + row * step) when the rows are evenly spaced, as gap-filled sessions are,
+    otherwise int32 millisecond offsets from the start, or int64 epoch nanoseconds if those don't fit.
+    Value columns of the registered data types whose readings are whole numbers from 1 to 255 (e.g. bpm) are
+    uint8 with 0 for a missing reading, other value columns float32. DATA ERROR and other text columns are
+    category codes. frame() rebuilds a DataFrame of just the rows asked for.
+
+    A session may hold only part of its file (see hrStore.read_frame_window): first_row is the file row of its
+    first row and total_rows the number of rows in the file.
+    """
+
+    def __init__(self, time_column, time_dtype, length, start, step=None, offsets=None, offset_scale=1,
+                 columns=None, byte_columns=(), categories=None, first_row=0, total_rows=None):
+        self.time_column = time_column
+        self.time_dtype = np.dtype(time_dtype)
+        self.length = length
+        self.first_row = first_row
+        self.total_rows = length if total_rows is None else total_rows
+        self.start = start                # First timestamp (epoch nanoseconds)
+        self.step = step                  # Nanoseconds between rows, None if the spacing isn't even
+        self.offsets = offsets            # Row timestamps relative to start, in units of offset_scale ns
+        self.offset_scale = offset_scale
+        self.columns = columns or {}      # name -> stored array, in the column order of the source frame
+        self.byte_columns = set(byte_columns)
+        self.categories = categories or {}  # name -> CategoricalDtype of a column stored as codes
+
+    @classmethod
+    def from_frame(cls, df, time_column="watch_timestamp", first_row=0, total_rows=None):
+        nanoseconds = df[time_column].to_numpy().astype("datetime64[ns]").view(np.int64)
+        session = cls(time_column, df[time_column].dtype, len(df), 0, first_row=first_row, total_rows=total_rows)
+        session._set_timestamps(nanoseconds)
+
+        values = compact_columns()
+        for name in df.columns:
+            if name == time_column:
+                continue
+            column = df[name]
+            if name in values and pd.api.types.is_numeric_dtype(column.dtype):
+                data = column.to_numpy(dtype="float32", na_value=np.nan)
+                valid = data[~np.isnan(data)]
+                if len(valid) and valid.min() >= 1 and valid.max() <= 255 and (valid == np.round(valid)).all():
+                    session.byte_columns.add(name)
+                    data = np.nan_to_num(data, nan=0).astype(np.uint8)
+                session.columns[name] = data
+            elif isinstance(column.dtype, pd.CategoricalDtype) or not pd.api.types.is_numeric_dtype(column.dtype):
+                categorical = column.astype("category")
+                session.categories[name] = categorical.dtype
+                session.columns[name] = categorical.cat.codes.to_numpy()
+            else:
+                session.columns[name] = column.to_numpy()
+        return session
+
+    def _set_timestamps(self, nanoseconds):
+        if len(nanoseconds) == 0:
+            self.step = 0
+            return
+        self.start = int(nanoseconds[0])
+        steps = np.diff(nanoseconds)
+        if len(steps) == 0 or (steps[0] > 0 and (steps == steps[0]).all()):
+            self.step = int(steps[0]) if len(steps) else 0
+            return
+
+        relative = nanoseconds - self.start
+        if (relative >= 0).all() and relative.max() // NS_PER_MS <= np.iinfo(np.int32).max and \
+                not (relative % NS_PER_MS).any():
+            self.offsets = (relative // NS_PER_MS).astype(np.int32)
+            self.offset_scale = NS_PER_MS
+        else:
+            # Epoch nanoseconds as they are, which also keeps NaT (the smallest int64) intact
+            self.start = 0
+            self.offsets = nanoseconds.copy()
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def nbytes(self):
+        """Memory held by the arrays."""
+        arrays = list(self.columns.values()) + ([self.offsets] if self.offsets is not None else [])
+        return sum(array.nbytes for array in arrays)
+
+    @property
+    def hours(self):
+        """Hours of recording between the first and last row."""
+        if self.length < 2:
+            return 0.0
+        return (self._nanoseconds(self.length - 1, self.length)[0] - self._nanoseconds(0, 1)[0]) / NS_PER_HOUR
+
+    def _nanoseconds(self, first, last):
+        if self.offsets is None:
+            return self.start + np.arange(first, last, dtype=np.int64) * self.step
+        return self.start + self.offsets[first:last].astype(np.int64) * self.offset_scale
+
+    def timestamp(self, row):
+        """Timestamp of one row (negative rows count from the end)."""
+        row = row + self.length if row < 0 else row
+        return pd.Timestamp(self._nanoseconds(row, row + 1)[0])
+
+    def searchsorted(self, timestamp, side="left"):
+        """First row at or after (side='left') or after (side='right') a timestamp."""
+        relative = pd.Timestamp(timestamp).as_unit("ns").value - self.start
+        if self.offsets is None:
+            if self.step == 0:
+                row = int(relative > 0 if side == "left" else relative >= 0)
+            else:
+                row = -(-relative // self.step) if side == "left" else relative // self.step + 1
+            return min(max(row, 0), self.length)
+        # Offsets are whole units of offset_scale: round the target up for 'left' and down for 'right'
+        target = -(-relative // self.offset_scale) if side == "left" else relative // self.offset_scale
+        return int(np.searchsorted(self.offsets, np.int64(target), side=side))
+
+    def bounds(self, start=None, end=None):
+        """
+        Rows between start and end, found without reading the timestamps when they are implicit. One row beyond
+        each edge is kept so the line runs to the edges of the visible range.
+        """
+        first = self.searchsorted(start) - 1 if start is not None else 0
+        last = self.searchsorted(end, side="right") + 1 if end is not None else self.length
+        return max(first, 0), min(last, self.length)
+
+    def frame(self, first=0, last=None):
+        """
+        DataFrame of rows first to last, indexed by row number in the file like df.iloc[first:last]. Only those
+        rows are decoded; float32 and other stored columns are views of the cached arrays and must not be modified.
+        """
+        last = self.length if last is None else min(last, self.length)
+        first = min(max(first, 0), last)
+        data = {self.time_column: self._nanoseconds(first, last).view("datetime64[ns]").astype(self.time_dtype)}
+        for name, stored in self.columns.items():
+            values = stored[first:last]
+            if name in self.byte_columns:
+                values = np.where(values == 0, np.float32(np.nan), values.astype(np.float32))
+            elif name in self.categories:
+                values = pd.Categorical.from_codes(values, dtype=self.categories[name])
+            data[name] = values
+        return pd.DataFrame(data, index=pd.RangeIndex(self.first_row + first, self.first_row + last))
+
+class ArrayAppender:
+    """
+    Write a 1-D .npy file piece by piece. The header is rewritten with the final length on close; NumPy pads
+    headers so that this never changes their size.
+    """
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self._file = open(path, "wb")
+        self._write_header()
+
+    def _write_header(self):
+        np.lib.format.write_array_header_1_0(
+            self._file, {"descr": np.lib.format.dtype_to_descr(self.dtype), "fortran_order": False, "shape": (self.rows,)})
+
+    def append(self, array):
+        """Append an array and return the row where it starts."""
+        start = self.rows
+        self._file.write(np.ascontiguousarray(array, dtype=self.dtype).tobytes())
+        self.rows += len(array)
+        return start
+
+    def close(self):
+        self._file.seek(0)
+        self._write_header()
+        self._file.close()
+
+def array_key(name, dtype):
+    """File name (without .npy) of the store array holding a column in a dtype, e.g. 'data_error-int8'."""
+    return f"{re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')}-{np.dtype(dtype).name}"
+
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def find_session_files(session_dir):
+    """'P1/Session_1' -> processed session file, for every session under session_dir."""
+    sessions = {}
+    for root, dirs, files in os.walk(session_dir):
+        dirs.sort()
+        for file in sorted(files):
+            if is_data_file(file):
+                path = os.path.join(root, file)
+                relative = os.path.splitext(os.path.relpath(path, session_dir))[0].replace(os.sep, "/")
+                sessions[relative] = path
+    return sessions
+
+def pack_sessions(session_dir, output_dir, time_column="watch_timestamp"):
+    """
+    Pack every processed session under session_dir into a store in output_dir. The store is built next to
+    output_dir and swapped in when complete, so workers still mapping the previous one keep valid arrays.
+    Returns the number of sessions packed.
+    """
+    partial_dir = output_dir + ".partial"
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    os.makedirs(partial_dir)
+
+    arrays = {}  # array key -> ArrayAppender
+    index = {"version": STORE_VERSION, "time_column": time_column, "time_dtype": None, "sessions": {}}
+
+    def append(name, array):
+        key = array_key(name, array.dtype)
+        if key not in arrays:
+            arrays[key] = ArrayAppender(os.path.join(partial_dir, key + ".npy"), array.dtype)
+        return {"array": key, "row": arrays[key].append(array)}
+
+    try:
+        for relative, path in find_session_files(session_dir).items():
+            session = SessionArrays.from_frame(read_frame(path), time_column)
+            index["time_dtype"] = index["time_dtype"] or session.time_dtype.str
+            entry = {
+                "source": os.path.relpath(path, session_dir),
+                "signature": file_signature(path),
+                "rows": session.length,
+                "start": session.start,
+                "step": session.step,
+                "offset_scale": session.offset_scale,
+                "time": append(time_column, session.offsets) if session.offsets is not None else None,
+                "columns": {},
+            }
+            for name, stored in session.columns.items():
+                column = append(name, stored)
+                if name in session.byte_columns:
+                    column["encoding"] = "byte"
+                elif name in session.categories:
+                    column["encoding"] = "codes"
+                    column["categories"] = session.categories[name].categories.tolist()
+                entry["columns"][name] = column
+            index["sessions"][relative] = entry
+    finally:
+        for appender in arrays.values():
+            appender.close()
+
+    index["arrays"] = {key: appender.dtype.str for key, appender in arrays.items()}
+    with open(os.path.join(partial_dir, "index.json"), "w") as f:
+        json.dump(index, f, indent=1)
+
+    # Swap the complete store in; open memory maps of the old files stay valid until they are closed
+    if os.path.exists(output_dir):
+        old_dir = output_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.replace(output_dir, old_dir)
+        os.replace(partial_dir, output_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    else:
+        os.replace(partial_dir, output_dir)
+    return len(index["sessions"])
+
+class SessionStore:
+    """
+    Read-only view of the packed stores in base_dir. Arrays are memory-mapped on first use, so sessions are
+    slices of the page cache shared by every worker process rather than copies in each one. A session
+    whose processed file changed since it was packed isn't served from the store.
+    """
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self._stores = {}  # data type -> (index.json signature, index, {array key: memmap})
+        self._lock = threading.Lock()
+
+    def _store(self, data_type):
+        index_path = os.path.join(self.base_dir, data_type, "index.json")
+        try:
+            signature = file_signature(index_path)
+        except OSError:
+            return None
+        with self._lock:
+            store = self._stores.get(data_type)
+            if store is None or store[0] != signature:
+                # Packed again since it was opened: drop the old maps and read the new index
+                with open(index_path) as f:
+                    index = json.load(f)
+                if index.get("version") != STORE_VERSION:
+                    logger.warning("Ignoring session store of version %s: %s", index.get("version"), index_path)
+                    index = {"sessions": {}}
+                store = self._stores[data_type] = (signature, index, {})
+            return store
+
+    def _array(self, data_type, store, key):
+        maps = store[2]
+        with self._lock:
+            if key not in maps:
+                maps[key] = np.load(os.path.join(self.base_dir, data_type, key + ".npy"), mmap_mode="r")
+            return maps[key]
+
+    def session(self, data_type, relative_session, source_path):
+        """
+        SessionArrays of a session ('P1/Session_1') backed by the memory-mapped arrays, or None if the store
+        doesn't have it or source_path changed since it was packed.
+        """
+        store = self._store(data_type)
+        if store is None:
+            return None
+        index = store[1]
+        entry = index["sessions"].get(relative_session)
+        if entry is None or source_path is None or file_signature(source_path) != entry["signature"]:
+            return None
+
+        def view(location):
+            return self._array(data_type, store, location["array"])[location["row"]:location["row"] + entry["rows"]]
+
+        session = SessionArrays(
+            index["time_column"], index["time_dtype"], entry["rows"], entry["start"], step=entry["step"],
+            offsets=view(entry["time"]) if entry["time"] is not None else None, offset_scale=entry["offset_scale"],
+        )
+        for name, column in entry["columns"].items():
+            session.columns[name] = view(column)
+            if column.get("encoding") == "byte":
+                session.byte_columns.add(name)
+            elif column.get("encoding") == "codes":
+                session.categories[name] = pd.CategoricalDtype(column["categories"])
+        return session
+
+    def info(self):
+        """Sessions packed per data type, for the data types whose store has been opened."""
+        with self._lock:
+            return {data_type: len(index["sessions"]) for data_type, (_, index, _) in self._stores.items()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Pack the processed sessions into memory-mapped arrays shared by every web worker.")
+    parser.add_argument("--data-type", choices=DATA_TYPES, action="append",
+                        help="Data type to pack (repeatable; default every type with processed sessions)")
+    parser.add_argument("--output-dir", default=store_dir)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    for name in args.data_type or DATA_TYPES:
+        data_type = DATA_TYPES[name]
+        if not os.path.isdir(data_type.session_dir):
+            if args.data_type:
+                logger.error("No processed sessions in %s; run hrFix.py --data-type %s first", data_type.session_dir, name)
+                return 1
+            continue
+        count = pack_sessions(data_type.session_dir, os.path.join(args.output_dir, name), data_type.time_column)
+        logger.info("Packed %d %s sessions into %s", count, name, os.path.join(args.output_dir, name))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dataTypes import DATA_TYPES, get_data_type
+from hrManifest import Manifest
+
+# Render the app's figures to files for reports, without the web page: the overview of every data type and the
+# session view of every (or a filtered set of) participant/session, drawn by the same code as the app.
+# exports/<data type>/overview.<ext>
+# exports/<data type>/<P#|N#>/<Session>.<ext>
+
+export_dir = "exports"
+manifest_path = "hrExport_manifest.json"
+EXPORT_FORMATS = ("html", "json", "png", "svg", "pdf")
+IMAGE_FORMATS = ("png", "svg", "pdf")  # Written by plotly through the kaleido package
+default_width = 1200  # Pixels, as the page assumes (application.downsample.DEFAULT_PLOT_WIDTH)
+default_height = 600
+
+logger = logging.getLogger("hrExport")
+
+def app_modules():
+    """The app's routes and API modules. Importing them sets up the Flask app and indexes the data folders."""
+    from application import api, routes
+    return routes, api
+
+def find_export_units(routes, data_types=None, participants=None, sessions=None, overview=True):
+    """
+    Figures to export as unit name ('heartrate/overview' or 'heartrate/P1/Session_1') -> the files they are
+    drawn from, for the data types, participants and sessions given (all of them for None). Sessions without
+    a processed session file are left out.
+    """
+    catalog = routes.catalog
+    units = {}
+    for data_type in catalog.data_types():
+        if get_data_type(data_type) is None or (data_types and data_type not in data_types):
+            continue
+        if overview:
+            units[f"{data_type}/overview"] = sorted(catalog.paths(data_type))
+        for participant in catalog.participants(data_type):
+            if participants and participant not in participants:
+                continue
+            for session in catalog.sessions(data_type, participant):
+                if sessions and session not in sessions:
+                    continue
+                session_file, metadata_file = routes.session_paths(participant, session, data_type)
+                if not session_file:
+                    continue
+                pyramid_file = routes.session_pyramid_path(participant, session, data_type)
+                units[f"{data_type}/{participant}/{session}"] = [
+                    path for path in (session_file, metadata_file, pyramid_file) if path]
+    return units
+
+def write_figure(fig, output_file, fmt, width, height, offline=False):
+    """Save a figure as HTML, plotly JSON or a static image."""
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    if fmt == "html":
+        fig.write_html(output_file, include_plotlyjs=True if offline else "cdn")
+    elif fmt == "json":
+        fig.write_json(output_file)
+    else:
+        fig.write_image(output_file, format=fmt, width=width, height=height)
+
+def export_unit(unit, output_dir, fmt, width=default_width, height=default_height, offline=False):
+    """Render one overview or session figure. Returns the files written."""
+    routes, api = app_modules()
+    from application.downsample import max_points_for_width
+    from application.plots import overview_figure
+
+    data_type, *selection = unit.split("/")
+    if selection == ["overview"]:
+        fig = overview_figure(routes.summary_index.table(data_type), data_type)
+    else:
+        participant, session = selection
+        # The whole session at the export width, from its pyramid where one is fine enough
+        fig, _ = api.session_view(participant, session, get_data_type(data_type),
+                                  max_points=max_points_for_width(width),
+                                  pyramid_file=routes.session_pyramid_path(participant, session, data_type))
+    output_file = os.path.join(output_dir, f"{unit}.{fmt}")
+    write_figure(fig, output_file, fmt, width, height, offline)
+    return [output_file]
+
+def export_all(units, output_dir, fmt, width=default_width, height=default_height, offline=False, workers=None,
+               manifest=None, full=False, available=None):
+    """
+    Render every unit, one per worker process. With a manifest only figures whose data changed since they were
+    written are rendered (all of them if full is set), and figures of units no longer in available (every
+    exportable unit, default units) are removed. Returns the list of units that failed.
+    """
+    if manifest is not None:
+        for output in manifest.remove_missing_units(available if available is not None else units):
+            logger.info("Removed figure of deleted session: %s", output)
+        if not full:
+            units = {unit: inputs for unit, inputs in units.items() if not manifest.is_current(unit, inputs)}
+    logger.info("%d figures to export", len(units))
+
+    failed = []
+    done = 0
+
+    def report(unit, outputs=None, error=None):
+        nonlocal done
+        done += 1
+        if error is not None:
+            failed.append(unit)
+            logger.error("[%d/%d] Failed %s: %s", done, len(units), unit, error)
+            return
+        if manifest is not None:
+            manifest.record(unit, units[unit], outputs)
+        logger.info("[%d/%d] Exported %s", done, len(units), outputs[0])
+
+    if workers == 1:
+        for unit in units:
+            try:
+                report(unit, export_unit(unit, output_dir, fmt, width, height, offline))
+            except Exception as e:
+                report(unit, error=e)
+        return failed
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(export_unit, unit, output_dir, fmt, width, height, offline): unit
+            for unit in units
+        }
+        for future in as_completed(futures):
+            try:
+                report(futures[future], future.result())
+            except Exception as e:
+                report(futures[future], error=e)
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the overview and session figures of the processed data.")
+    parser.add_argument("--output-dir", default=export_dir)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="html",
+                        help="png, svg and pdf need the kaleido package")
+    parser.add_argument("--data-type", action="append", choices=DATA_TYPES,
+                        help="Only export this data type (repeatable)")
+    parser.add_argument("--participant", action="append", help="Only export sessions of this participant (repeatable)")
+    parser.add_argument("--session", action="append", help="Only export this session, e.g. Session_1 (repeatable)")
+    parser.add_argument("--no-overview", action="store_true", help="Skip the overview figures")
+    parser.add_argument("--width", type=int, default=default_width,
+                        help="Plot width in pixels; sets the points per session plot and the image width")
+    parser.add_argument("--height", type=int, default=default_height, help="Image height in pixels")
+    parser.add_argument("--offline", action="store_true",
+                        help="Embed plotly.js in every HTML file instead of loading it from the CDN")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes (1 renders in this process)")
+    parser.add_argument("--manifest", default=manifest_path,
+                        help="Manifest of input fingerprints used to skip figures that are up to date")
+    parser.add_argument("--full", action="store_true", help="Render every figure, ignoring the manifest")
+    args = parser.parse_args(argv)
+
+    if args.format in IMAGE_FORMATS and importlib.util.find_spec("kaleido") is None:
+        parser.error(f"--format {args.format} needs the kaleido package (pip install kaleido)")
+
+    # The data is indexed once per run, so the app doesn't need to watch the folders
+    os.environ.setdefault("MINDMAP_WATCH_INTERVAL", "0")
+    routes, _ = app_modules()
+    # The app logs every step to its own file; only this script's progress is shown here
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s", force=True)
+    logger.setLevel(logging.INFO)
+
+    available = find_export_units(routes)
+    units = find_export_units(routes, args.data_type, args.participant, args.session, overview=not args.no_overview)
+    manifest = Manifest(args.manifest, config={
+        'output_dir': args.output_dir, 'format': args.format, 'width': args.width, 'height': args.height,
+        'offline': args.offline,
+    })
+    failed = export_all(units, args.output_dir, args.format, args.width, args.height, args.offline,
+                        workers=args.workers, manifest=manifest, full=args.full, available=available)
+    manifest.save()
+
+    if failed:
+        logger.error("Export finished with %d failed figures: %s", len(failed), ", ".join(sorted(failed)))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
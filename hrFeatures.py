@@ -0,0 +1,225 @@
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from dataTypes import HEARTRATE
+from hrManifest import Manifest
+from hrStore import DEFAULT_FORMAT, FORMATS, is_data_file, read_frame, write_frame
+
+# Rolling heart-rate features of every processed session, computed once and stored next to the processed data:
+# Processed_heartrate_features/<P#|N#>/<Session>.<ext>           one row per second of the session file
+# Processed_heartrate_features/<P#|N#>/<Session>_sublevels.<ext>  one row per sub-level
+
+processed_sublevel_dir = HEARTRATE.sublevel_dir
+processed_session_dir = HEARTRATE.session_dir
+features_dir = f"Processed_{HEARTRATE.name}_features"
+manifest_path = "hrFeatures_manifest.json"
+default_window = 60  # Seconds per rolling window
+
+# Rolling feature columns and how they are labelled in plots
+FEATURE_LABELS = {
+    "bpm_mean": "Rolling mean (bpm)",
+    "bpm_sd": "Rolling SD (bpm)",
+    "rmssd_proxy": "RMSSD proxy (ms)",
+    "slope": "Trend (bpm/min)",
+    "coverage": "Valid fraction",
+}
+
+logger = logging.getLogger("hrFeatures")
+
+def valid_bpm(df):
+    """bpm as float64 with SR gaps, ZERO readings and any other non-positive value set to NaN."""
+    bpm = df["bpm"].to_numpy(dtype="float64", copy=True)
+    bpm[~(bpm > 0)] = np.nan
+    if "DATA ERROR" in df:
+        bpm[(df["DATA ERROR"] != "").to_numpy(dtype=bool)] = np.nan
+    return bpm
+
+def rolling_features(df, window=default_window):
+    """
+    Rolling features over a gap-filled session ending at each second, for windows of `window` seconds:
+    mean and SD of bpm, RMSSD of the RR intervals implied by successive bpm readings (a proxy, since the
+    watch reports 1 Hz bpm rather than beats), least-squares trend in bpm per minute and the fraction of
+    valid seconds. SR and ZERO seconds are left out; windows with fewer than half their seconds valid are NaN.
+    """
+    timestamps = pd.DatetimeIndex(df["watch_timestamp"])
+    bpm = pd.Series(valid_bpm(df), index=timestamps)
+    valid = bpm.notna()
+    span = f"{window}s"
+    min_periods = max(window // 2, 2)
+
+    def roll(series):
+        return series.rolling(span, min_periods=1)
+
+    count = roll(valid.astype("float64")).sum()
+    enough = count >= min_periods
+
+    # Successive differences are NaN next to any missing second, so gaps never count as a beat-to-beat change
+    successive = (60000.0 / bpm).diff()
+
+    # Trend from rolling sums of x, y, x*x and x*y over the valid seconds (x in seconds from the start)
+    x = pd.Series((timestamps - timestamps[0]).total_seconds(), index=timestamps).where(valid, 0.0)
+    y = bpm.fillna(0.0)
+    sum_x, sum_y = roll(x).sum(), roll(y).sum()
+    denominator = count * roll(x * x).sum() - sum_x ** 2
+    slope = (count * roll(x * y).sum() - sum_x * sum_y) / denominator.where(denominator > 0) * 60
+
+    features = pd.DataFrame({
+        "bpm_mean": bpm.rolling(span, min_periods=min_periods).mean(),
+        "bpm_sd": bpm.rolling(span, min_periods=min_periods).std(),
+        "rmssd_proxy": np.sqrt((successive ** 2).rolling(span, min_periods=min_periods - 1).mean()),
+        "slope": slope.where(enough),
+        "coverage": count / window,
+    })
+    features = features.astype("float32").reset_index(drop=True)
+    features.insert(0, "watch_timestamp", df["watch_timestamp"].to_numpy())
+    return features
+
+def sublevel_label(filename):
+    """'watch_P1_L1_S2_1234567_heartrate.parquet' -> 'L1_S2'; the file stem for other names."""
+    parts = os.path.splitext(filename)[0].split("_")
+    return "_".join(parts[2:4]) if len(parts) >= 6 else os.path.splitext(filename)[0]
+
+def sublevel_aggregates(frames):
+    """One row of whole-recording features per sub-level, from {label: processed sub-level frame}."""
+    rows = []
+    for label, df in frames.items():
+        bpm = valid_bpm(df)
+        valid = ~np.isnan(bpm)
+        seconds = (df["watch_timestamp"] - df["watch_timestamp"].iloc[0]).dt.total_seconds().to_numpy()
+        successive = np.diff(60000.0 / bpm)
+        successive = successive[~np.isnan(successive)]
+        errors = df["DATA ERROR"] if "DATA ERROR" in df else pd.Series(dtype=object)
+        rows.append({
+            "sublevel": label,
+            "start": df["watch_timestamp"].iloc[0],
+            "end": df["watch_timestamp"].iloc[-1],
+            "seconds": len(df),
+            "coverage": valid.mean(),
+            "bpm_mean": bpm[valid].mean() if valid.any() else np.nan,
+            "bpm_sd": bpm[valid].std(ddof=1) if valid.sum() > 1 else np.nan,
+            "rmssd_proxy": np.sqrt(np.mean(successive ** 2)) if len(successive) else np.nan,
+            "slope": np.polyfit(seconds[valid], bpm[valid], 1)[0] * 60 if valid.sum() > 1 else np.nan,
+            "sr_errors": int((errors == "SR").sum()),
+            "zero_errors": int((errors == "ZERO").sum()),
+        })
+    return pd.DataFrame(rows).sort_values("start", kind="mergesort").reset_index(drop=True) if rows else None
+
+def feature_paths(output_dir, relative_session, fmt=DEFAULT_FORMAT):
+    """Rolling feature file and sub-level aggregate file of a session ('P1/Session_1')."""
+    base = os.path.join(output_dir, relative_session)
+    return base + FORMATS[fmt], f"{base}_sublevels{FORMATS[fmt]}"
+
+def process_feature_unit(relative_session, session_file, sublevel_files, output_dir, window, fmt):
+    """Compute and save the features of one session. Returns the files written."""
+    features_file, sublevels_file = feature_paths(output_dir, relative_session, fmt)
+    outputs = []
+
+    session_df = read_frame(session_file)
+    if not session_df.empty:
+        write_frame(rolling_features(session_df, window), features_file)
+        outputs.append(features_file)
+
+    frames = {sublevel_label(os.path.basename(path)): read_frame(path) for path in sublevel_files}
+    aggregates = sublevel_aggregates({label: df for label, df in frames.items() if not df.empty})
+    if aggregates is not None:
+        write_frame(aggregates, sublevels_file)
+        outputs.append(sublevels_file)
+    return outputs
+
+def find_feature_units(session_dir, sublevel_dir):
+    """relative session -> (processed session file, its processed sub-level files)."""
+    units = {}
+    for root, dirs, files in os.walk(session_dir):
+        dirs.sort()
+        for file in sorted(files):
+            if not is_data_file(file):
+                continue
+            session_file = os.path.join(root, file)
+            relative_session = os.path.splitext(os.path.relpath(session_file, session_dir))[0]
+            sublevel_folder = os.path.join(sublevel_dir, relative_session)
+            sublevel_files = sorted(
+                os.path.join(sublevel_folder, name) for name in os.listdir(sublevel_folder) if is_data_file(name)
+            ) if os.path.isdir(sublevel_folder) else []
+            units[relative_session.replace(os.sep, "/")] = (session_file, sublevel_files)
+    return units
+
+def process_all_features(session_dir, sublevel_dir, output_dir, window=default_window, workers=None, manifest=None,
+                         full=False, fmt=DEFAULT_FORMAT):
+    """
+    Compute the features of every processed session, one session per worker process. With a manifest only
+    sessions whose processed files changed are recomputed. Returns the list of sessions that failed.
+    """
+    units = find_feature_units(session_dir, sublevel_dir)
+    inputs = {session: [session_file] + sublevel_files for session, (session_file, sublevel_files) in units.items()}
+    if manifest is not None:
+        for output in manifest.remove_missing_units(units):
+            logger.info("Removed features of deleted session: %s", output)
+        if not full:
+            units = {session: unit for session, unit in units.items() if not manifest.is_current(session, inputs[session])}
+    logger.info("%d sessions to process", len(units))
+
+    failed = []
+
+    def report(session, outputs=None, error=None):
+        if error is not None:
+            failed.append(session)
+            logger.error("Failed %s: %s", session, error)
+            return
+        if manifest is not None:
+            manifest.record(session, inputs[session], outputs)
+        logger.info("Features saved for %s (%d files)", session, len(outputs))
+
+    if workers == 1:
+        for session, (session_file, sublevel_files) in units.items():
+            try:
+                report(session, process_feature_unit(session, session_file, sublevel_files, output_dir, window, fmt))
+            except Exception as e:
+                report(session, error=e)
+        return failed
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_feature_unit, session, session_file, sublevel_files, output_dir, window, fmt): session
+            for session, (session_file, sublevel_files) in units.items()
+        }
+        for future in as_completed(futures):
+            try:
+                report(futures[future], future.result())
+            except Exception as e:
+                report(futures[future], error=e)
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute rolling heart-rate and variability features of every processed session.")
+    parser.add_argument("--session-dir", default=processed_session_dir)
+    parser.add_argument("--sublevel-dir", default=processed_sublevel_dir)
+    parser.add_argument("--output-dir", default=features_dir)
+    parser.add_argument("--window", type=int, default=default_window, help="Rolling window in seconds")
+    parser.add_argument("--format", choices=FORMATS, default=DEFAULT_FORMAT, help="Storage format of the feature files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes (1 processes sessions in this process)")
+    parser.add_argument("--manifest", default=manifest_path,
+                        help="Manifest of input fingerprints used to skip unchanged sessions")
+    parser.add_argument("--full", action="store_true", help="Recompute every session, ignoring the manifest")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    manifest = Manifest(args.manifest, config={'output_dir': args.output_dir, 'window': args.window, 'format': args.format})
+    failed = process_all_features(args.session_dir, args.sublevel_dir, args.output_dir, window=args.window,
+                                  workers=args.workers, manifest=manifest, full=args.full, fmt=args.format)
+    manifest.save()
+
+    if failed:
+        logger.error("Feature extraction finished with %d failed sessions: %s", len(failed), ", ".join(sorted(failed)))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,118 +1,481 @@
+import argparse
+import logging
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+import numpy as np
 import pandas as pd
 
+from dataTypes import DATA_TYPES, HEARTRATE
+from hrManifest import Manifest
+from hrMeta import csv_time_bounds, metadata_path, write_session_metadata
+from hrPyramid import PyramidBuilder, pyramid_levels, pyramid_path
+from hrStore import DEFAULT_FORMAT, FORMATS, FrameWriter, with_format, write_frame
+
 # Base directory (This is the only thing you need to change to make this work with yours hopefully)
-raw_sublevel_dir = "Watch_data_org/heartrate_data"
-processed_sublevel_dir = "Processed_heartrate_sublevel_data"
-processed_session_dir = "Processed_heartrate_sessions_data"
+# Folders of the other data types follow the same layout, see dataTypes.py
+raw_sublevel_dir = HEARTRATE.raw_dir
+processed_sublevel_dir = HEARTRATE.sublevel_dir
+processed_session_dir = HEARTRATE.session_dir
+session_metadata_dir = HEARTRATE.metadata_dir
+session_pyramid_dir = HEARTRATE.pyramid_dir
+manifest_path = HEARTRATE.manifest_path("hrFix")
+default_chunksize = 100000  # Rows per chunk in streaming mode
 
-# Check for Dircetories 
-os.makedirs(processed_sublevel_dir, exist_ok=True)
-os.makedirs(processed_session_dir, exist_ok=True)
+logger = logging.getLogger("hrFix")
 
-# Function: Add rows for each second missed in the DataFrame, marking errors in a new column. 
-def add_missing_seconds(df):
+# Function: Add rows for each sample missed in the DataFrame, marking errors in a new column.
+# The sample period, the columns where 0 is an error and the derived columns come from the data type.
+# Vectorized: every output row is placed by position instead of being appended one dict at a time.
+def add_missing_samples(df, data_type=HEARTRATE):
 
-    new_rows = []
-    for i in range(len(df) - 1):
-        current_row = df.iloc[i].to_dict()
+    df = df.reset_index(drop=True)
+    if df.empty:
+        return data_type.add_derived_columns(df.assign(**{'DATA ERROR': pd.Series(dtype=object)}))
 
-        # Mark ZERO error if bpm is 0
-        if current_row['bpm'] == 0:
-            current_row['bpm'] = None
-            current_row['DATA ERROR'] = "ZERO"
-        else:
-            current_row['DATA ERROR'] = ""
-
-        new_rows.append(current_row)
-
-        # Add rows for missing seconds
-        time_diff = (df.iloc[i + 1]['watch_timestamp'] - df.iloc[i]['watch_timestamp']).total_seconds()
-        if time_diff > 1:
-            current_time = df.iloc[i]['watch_timestamp']
-            for _ in range(int(time_diff) - 1):
-                current_time += pd.Timedelta(seconds=1)
-                new_rows.append({
-                    'watch_timestamp': current_time,
-                    'bpm': None,
-                    'DATA ERROR': "SR"  # Sample Rate error
-                })
-
-    # Process the last row
-    last_row = df.iloc[-1].to_dict()
-    if last_row['bpm'] == 0:
-        last_row['bpm'] = None
-        last_row['DATA ERROR'] = "ZERO"
-    else:
-        last_row['DATA ERROR'] = ""
+    # Whole sample periods missing after each row (the last row has nothing after it)
+    period = data_type.period
+    time_diff = df['watch_timestamp'].diff().shift(-1)
+    gaps = np.where((time_diff > period).to_numpy(), (time_diff // period).to_numpy() - 1, 0).astype(np.int64)
 
-    new_rows.append(last_row)
-    return pd.DataFrame(new_rows)
+    # Each original row is shifted down by the number of rows inserted before it
+    inserted_before = np.cumsum(gaps) - gaps
+    positions = np.arange(len(df)) + inserted_before
+    total_rows = len(df) + int(gaps.sum())
+    result = df.set_axis(positions).reindex(np.arange(total_rows))
 
-#Function: Process a single sub-level CSV file.
-def process_sublevel_csv(input_file, output_file):
+    # Timestamps of the inserted rows count up one period from the row that precedes the gap
+    sr_mask = np.ones(total_rows, dtype=bool)
+    sr_mask[positions] = False
+    if sr_mask.any():
+        owner = np.repeat(np.arange(len(df)), gaps)
+        step = np.flatnonzero(sr_mask) - positions[owner]
+        timestamps = result['watch_timestamp'].copy()
+        timestamps[sr_mask] = (
+            df['watch_timestamp'].iloc[owner].array + pd.to_timedelta(step * period.value, unit='ns').array
+        )
+        result['watch_timestamp'] = timestamps
 
-    df = pd.read_csv(input_file)
-    if 'watch_timestamp' not in df or 'bpm' not in df:
-        print(f"Invalid file format, skipping: {input_file}")
-        return
+    # Mark ZERO error if a reading is 0 (e.g. bpm), SR (Sample Rate error) for every inserted sample
+    zero_mask = np.zeros(total_rows, dtype=bool)
+    zero_columns = list(data_type.zero_error_columns)
+    if zero_columns:
+        zero_mask[positions] = (df[zero_columns] == 0).any(axis=1).to_numpy()
+    if zero_mask.any():
+        for column in zero_columns:
+            result[column] = result[column].mask(zero_mask)
+
+    errors = np.full(total_rows, "", dtype=object)
+    errors[sr_mask] = "SR"
+    errors[zero_mask] = "ZERO"
+    result['DATA ERROR'] = errors
+
+    return data_type.add_derived_columns(result.reset_index(drop=True))
 
-    # Convert timestamp column to datetime and sort
+# Function: add_missing_samples for 1 Hz heart rate data.
+def add_missing_seconds(df):
+
+    return add_missing_samples(df, HEARTRATE)
+
+# Function: Read a raw CSV and parse its timestamps. Returns None if it lacks the data type's columns.
+def read_raw_csv(input_file, data_type=HEARTRATE):
+
+    df = pd.read_csv(input_file)
+    if not data_type.has_columns(df.columns):
+        return None
     df['watch_timestamp'] = pd.to_datetime(df['watch_timestamp'])
+    return df
+
+# Function: Sort by timestamp, fill missing seconds and save in the format given by the file extension.
+# The filled rows are also added to the pyramid builder, if one is given.
+def save_processed(df, output_file, data_type=HEARTRATE, pyramid=None):
+
     df = df.sort_values('watch_timestamp').reset_index(drop=True)
+    processed_df = add_missing_samples(df, data_type)
+    write_frame(processed_df, output_file)
+    if pyramid is not None:
+        pyramid.add(processed_df)
 
-    # Process data to handle zero values and missing seconds
-    processed_df = add_missing_seconds(df)
+class UnsortedInputError(ValueError):
+    """Raised when streaming finds a raw CSV that isn't sorted by watch_timestamp."""
 
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    processed_df.to_csv(output_file, index=False)
-    print(f"Processed and saved sub-level file: {output_file}")
+# Function: Check the header of a raw CSV for the data type's columns without reading the data.
+def has_data_columns(input_file, data_type=HEARTRATE):
 
-# Function: Combine sub-level CSVs for a session and process the combined data.
-def process_combined_session(session_path, output_file):
+    return data_type.has_columns(pd.read_csv(input_file, nrows=0).columns)
+
+# Function: Read a raw CSV in chunks with parsed timestamps. Raises UnsortedInputError if the rows
+# aren't in timestamp order, since streaming can't sort.
+def read_raw_chunks(input_file, chunksize):
+
+    last_timestamp = None
+    for chunk in pd.read_csv(input_file, chunksize=chunksize):
+        chunk['watch_timestamp'] = pd.to_datetime(chunk['watch_timestamp'])
+        timestamps = chunk['watch_timestamp']
+        if chunk.empty:
+            continue
+        if not timestamps.is_monotonic_increasing or (last_timestamp is not None and timestamps.iloc[0] < last_timestamp):
+            raise UnsortedInputError(f"Not sorted by watch_timestamp: {input_file}")
+        last_timestamp = timestamps.iloc[-1]
+        yield chunk.reset_index(drop=True)
 
-    combined_df = pd.DataFrame()
+# Function: Merge streams of timestamp-sorted chunks into one sorted stream (k-way merge).
+# Each round emits every buffered row up to the smallest "last timestamp" among the buffers,
+# which no stream can still undercut, so only one chunk per stream is held at a time.
+def merge_sorted_chunks(streams):
 
-    # Combine all sub-level CSVs in the session directory
+    streams = [iter(stream) for stream in streams]
+    pending = {}
+    for i, stream in enumerate(streams):
+        chunk = next(stream, None)
+        if chunk is not None:
+            pending[i] = chunk
+
+    while pending:
+        watermark = min(chunk['watch_timestamp'].iloc[-1] for chunk in pending.values())
+        ready = []
+        for i in sorted(pending):
+            chunk = pending[i]
+            cut = chunk['watch_timestamp'].searchsorted(watermark, side='right')
+            ready.append(chunk.iloc[:cut])
+            if cut < len(chunk):
+                pending[i] = chunk.iloc[cut:]
+                continue
+            chunk = next(streams[i], None)
+            if chunk is None:
+                del pending[i]
+            else:
+                pending[i] = chunk
+
+        merged = pd.concat(ready, ignore_index=True)
+        yield merged.sort_values('watch_timestamp', kind='mergesort').reset_index(drop=True)
+
+# Function: add_missing_samples over a stream of sorted chunks. The last row of each chunk is carried
+# into the next so gaps across chunk boundaries are filled too. Integer columns are written as floats,
+# as they are in memory whenever a session has any gap or zero reading.
+def add_missing_samples_chunks(chunks, data_type=HEARTRATE):
+
+    previous = None
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        if previous is None:
+            processed = add_missing_samples(chunk, data_type)
+        else:
+            processed = add_missing_samples(pd.concat([previous, chunk], ignore_index=True), data_type).iloc[1:]
+        previous = chunk.iloc[[-1]]
+
+        integer_columns = processed.select_dtypes('integer').columns
+        yield processed.astype({column: 'float64' for column in integer_columns})
+
+# Function: Fill and save one output from sorted raw CSVs in chunks, keeping memory bounded.
+# Falls back to sorting in memory if an input isn't sorted (returns False) or yields no rows.
+# Each written chunk is added to the pyramid builder, if one is given.
+def save_streamed(input_files, output_file, chunksize, data_type=HEARTRATE, pyramid=None):
+
+    try:
+        with FrameWriter(output_file) as writer:
+            streams = [read_raw_chunks(input_file, chunksize) for input_file in input_files]
+            for processed in add_missing_samples_chunks(merge_sorted_chunks(streams), data_type):
+                writer.write(processed)
+                if pyramid is not None:
+                    pyramid.add(processed)
+        if writer.rows:
+            return True
+        streamed = True
+    except UnsortedInputError:
+        streamed = False
+
+    if pyramid is not None:
+        pyramid.reset()
+    save_processed(pd.concat([read_raw_csv(input_file, data_type) for input_file in input_files]), output_file,
+                   data_type, pyramid)
+    return streamed
+
+#Function: Process a single sub-level CSV file.
+def process_sublevel_csv(input_file, output_file, data_type=HEARTRATE):
+
+    df = read_raw_csv(input_file, data_type)
+    if df is None:
+        logger.warning("Invalid file format, skipping: %s", input_file)
+        return
+
+    save_processed(df, output_file, data_type)
+    logger.info("Processed and saved sub-level file: %s", output_file)
+
+# Function: Combine sub-level CSVs for a session and process the combined data.
+def process_combined_session(session_path, output_file, data_type=HEARTRATE):
+
+    frames = []
     for file in os.listdir(session_path):
         if file.endswith('.csv'):
-            file_path = os.path.join(session_path, file)
-            df = pd.read_csv(file_path)
-            if 'watch_timestamp' in df and 'bpm' in df:
-                df['watch_timestamp'] = pd.to_datetime(df['watch_timestamp'])
-                combined_df = pd.concat([combined_df, df])
-
-    if combined_df.empty:
-        print(f"No valid data in session: {session_path}")
+            df = read_raw_csv(os.path.join(session_path, file), data_type)
+            if df is not None:
+                frames.append(df)
+
+    if not frames:
+        logger.warning("No valid data in session: %s", session_path)
         return
 
-    # Sort and process combined data
-    combined_df = combined_df.sort_values('watch_timestamp').reset_index(drop=True)
-    processed_df = add_missing_seconds(combined_df)
+    save_processed(pd.concat(frames), output_file, data_type)
+    logger.info("Processed and saved session: %s", output_file)
 
-    # Save processed session data
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    processed_df.to_csv(output_file, index=False)
-    print(f"Processed and saved session: {output_file}")
+# Function: Write the session's metadata markers (see hrMeta) from the first and last timestamp of
+# each raw file, ordered by filename as hrMeta does. Sessions without markers get no file.
+def save_session_metadata(result, bounds, metadata_dir, fmt):
 
-# Function: Process both sub-level and session-level data.
-def process_all_data(raw_dir, sublevel_dir, session_dir):
-  
-    print("Processing sub-level CSV files...")
-    for root, dirs, files in os.walk(raw_dir):
-        for file in files:
-            if file.endswith('.csv'):
-                input_file = os.path.join(root, file)
-                output_file = os.path.join(sublevel_dir, os.path.relpath(input_file, raw_dir))
-                process_sublevel_csv(input_file, output_file)
+    output_file = metadata_path(metadata_dir, result['session'], fmt)
+    if write_session_metadata([bounds[file] for file in sorted(bounds)], output_file):
+        result['outputs'].append(output_file)
 
-    print("Processing session CSV files...")
+# Function: Builder of the session's level-of-detail pyramid (see hrPyramid) over the first plotted column,
+# with buckets sized to the data type's sample rate, or None when no pyramid_dir is given.
+def session_pyramid(pyramid_dir, data_type):
+
+    if not pyramid_dir:
+        return None
+    return PyramidBuilder(data_type.plot_columns[0], data_type.time_column, pyramid_levels(data_type.sample_rate))
+
+# Function: Write the pyramid built alongside the session output.
+def save_session_pyramid(result, pyramid, pyramid_dir, fmt):
+
+    if pyramid is None:
+        return
+    output_file = pyramid_path(pyramid_dir, result['session'], fmt)
+    write_frame(pyramid.frame(), output_file)
+    result['outputs'].append(output_file)
+
+# Function: Process one session folder. Each raw CSV is parsed once and the parsed frames
+# are reused for the sub-level outputs, the combined session output and the metadata markers.
+# Runs inside worker processes, so problems are returned to the parent instead of logged here.
+def process_session_unit(session_path, csv_files, raw_dir, sublevel_dir, session_dir, metadata_dir=None,
+                         fmt=DEFAULT_FORMAT, data_type=HEARTRATE, pyramid_dir=None):
+
+    result = {'session': os.path.relpath(session_path, raw_dir), 'outputs': [], 'warnings': []}
+    frames = []
+    bounds = {}
+
+    for file in csv_files:
+        input_file = os.path.join(session_path, file)
+        df = read_raw_csv(input_file, data_type)
+        if df is None:
+            result['warnings'].append(f"Invalid file format, skipping: {input_file}")
+            # Still a sub-level for the markers if it has timestamps
+            file_bounds = csv_time_bounds(input_file)
+            if file_bounds is not None:
+                bounds[file] = file_bounds
+            continue
+        if not df.empty:
+            bounds[file] = (df['watch_timestamp'].iloc[0], df['watch_timestamp'].iloc[-1])
+
+        output_file = with_format(os.path.join(sublevel_dir, os.path.relpath(input_file, raw_dir)), fmt)
+        save_processed(df, output_file, data_type)
+        result['outputs'].append(output_file)
+        frames.append(df)
+
+    # Files directly in the raw directory have no session to combine into
+    if os.path.samefile(session_path, raw_dir):
+        return result
+
+    if metadata_dir:
+        save_session_metadata(result, bounds, metadata_dir, fmt)
+
+    if not frames:
+        result['warnings'].append(f"No valid data in session: {session_path}")
+        return result
+
+    output_file = os.path.join(session_dir, result['session'] + FORMATS[fmt])
+    pyramid = session_pyramid(pyramid_dir, data_type)
+    save_processed(pd.concat(frames), output_file, data_type, pyramid)
+    result['outputs'].append(output_file)
+    save_session_pyramid(result, pyramid, pyramid_dir, fmt)
+    return result
+
+# Function: Streaming version of process_session_unit for recordings too large to hold in memory.
+# Outputs are written chunk by chunk; the session output is a k-way merge of the sub-level files,
+# which are read a second time instead of being kept. Metadata markers only need the head and tail of each file.
+def stream_session_unit(session_path, csv_files, raw_dir, sublevel_dir, session_dir, metadata_dir, fmt, chunksize,
+                        data_type=HEARTRATE, pyramid_dir=None):
+
+    result = {'session': os.path.relpath(session_path, raw_dir), 'outputs': [], 'warnings': []}
+    input_files = []
+    bounds = {}
+
+    for file in csv_files:
+        input_file = os.path.join(session_path, file)
+        if metadata_dir:
+            file_bounds = csv_time_bounds(input_file)
+            if file_bounds is not None:
+                bounds[file] = file_bounds
+        if not has_data_columns(input_file, data_type):
+            result['warnings'].append(f"Invalid file format, skipping: {input_file}")
+            continue
+
+        output_file = with_format(os.path.join(sublevel_dir, os.path.relpath(input_file, raw_dir)), fmt)
+        if not save_streamed([input_file], output_file, chunksize, data_type):
+            result['warnings'].append(f"Not sorted by timestamp, processed in memory: {input_file}")
+        result['outputs'].append(output_file)
+        input_files.append(input_file)
+
+    # Files directly in the raw directory have no session to combine into
+    if os.path.samefile(session_path, raw_dir):
+        return result
+
+    if metadata_dir:
+        save_session_metadata(result, bounds, metadata_dir, fmt)
+
+    if not input_files:
+        result['warnings'].append(f"No valid data in session: {session_path}")
+        return result
+
+    output_file = os.path.join(session_dir, result['session'] + FORMATS[fmt])
+    pyramid = session_pyramid(pyramid_dir, data_type)
+    if not save_streamed(input_files, output_file, chunksize, data_type, pyramid):
+        result['warnings'].append(f"Session not sorted by timestamp, processed in memory: {session_path}")
+    result['outputs'].append(output_file)
+    save_session_pyramid(result, pyramid, pyramid_dir, fmt)
+    return result
+
+# Function: Find every folder holding raw CSVs in a single pass over the raw directory.
+def find_session_units(raw_dir):
+
+    units = []
     for root, dirs, files in os.walk(raw_dir):
-        for dir_name in dirs:
-            session_path = os.path.join(root, dir_name)
-            output_file = os.path.join(session_dir, os.path.relpath(session_path, raw_dir) + ".csv")
-            process_combined_session(session_path, output_file)
+        dirs.sort()
+        csv_files = [file for file in files if file.endswith('.csv')]
+        if csv_files:
+            units.append((root, csv_files))
+    return units
+
+# Function: Process both sub-level and session-level data, one session per worker process.
+# With a metadata_dir the session metadata markers are written in the same pass.
+# With a manifest only sessions whose inputs changed are processed (all of them if full is set),
+# and outputs of deleted inputs are removed. Returns the list of sessions that failed.
+# With a chunksize, sessions are streamed (stream_session_unit) instead of read whole.
+# With a pyramid_dir each session's level-of-detail pyramid is written in the same pass.
+def process_all_data(raw_dir, sublevel_dir, session_dir, workers=None, manifest=None, full=False, fmt=DEFAULT_FORMAT,
+                     chunksize=None, metadata_dir=None, data_type=HEARTRATE, pyramid_dir=None):
+
+    units = find_session_units(raw_dir)
+    logger.info("Found %d session folders in %s", len(units), raw_dir)
+
+    inputs = {
+        os.path.relpath(session_path, raw_dir): [os.path.join(session_path, file) for file in csv_files]
+        for session_path, csv_files in units
+    }
+    if manifest is not None:
+        for output in manifest.remove_missing_units(inputs):
+            logger.info("Removed output of deleted input: %s", output)
+        if not full:
+            units = [
+                (session_path, csv_files) for session_path, csv_files in units
+                if not manifest.is_current(os.path.relpath(session_path, raw_dir), [os.path.join(session_path, file) for file in csv_files])
+            ]
+        logger.info("%d session folders to process", len(units))
+
+    if chunksize:
+        process_unit = partial(stream_session_unit, metadata_dir=metadata_dir, fmt=fmt, chunksize=chunksize,
+                               data_type=data_type, pyramid_dir=pyramid_dir)
+    else:
+        process_unit = partial(process_session_unit, metadata_dir=metadata_dir, fmt=fmt, data_type=data_type,
+                               pyramid_dir=pyramid_dir)
+
+    failed = []
+    done = 0
+
+    def report(session, result=None, error=None):
+        nonlocal done
+        done += 1
+        if error is not None:
+            failed.append(session)
+            logger.error("[%d/%d] Failed %s: %s", done, len(units), session, error)
+            return
+        for warning in result['warnings']:
+            logger.warning(warning)
+        if manifest is not None:
+            for output in manifest.record(session, inputs[session], result['outputs']):
+                logger.info("Removed stale output: %s", output)
+        logger.info("[%d/%d] Processed %s (%d files written)", done, len(units), session, len(result['outputs']))
+
+    if workers == 1:
+        for session_path, csv_files in units:
+            session = os.path.relpath(session_path, raw_dir)
+            try:
+                report(session, process_unit(session_path, csv_files, raw_dir, sublevel_dir, session_dir))
+            except Exception as e:
+                report(session, error=e)
+        return failed
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_unit, session_path, csv_files, raw_dir, sublevel_dir, session_dir):
+                os.path.relpath(session_path, raw_dir)
+            for session_path, csv_files in units
+        }
+        for future in as_completed(futures):
+            try:
+                report(futures[future], future.result())
+            except Exception as e:
+                report(futures[future], error=e)
+
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill missing samples in raw watch CSVs and combine them per session.")
+    parser.add_argument("--data-type", choices=DATA_TYPES, default=HEARTRATE.name,
+                        help="Data stream to process; sets the default folders (see dataTypes.py)")
+    parser.add_argument("--raw-dir")
+    parser.add_argument("--sublevel-dir")
+    parser.add_argument("--session-dir")
+    parser.add_argument("--metadata-dir",
+                        help="Where the session metadata markers are written (same files as hrMeta.py)")
+    parser.add_argument("--pyramid-dir",
+                        help="Where the per-session level-of-detail pyramids are written (see hrPyramid.py)")
+    parser.add_argument("--format", choices=FORMATS, default=DEFAULT_FORMAT,
+                        help="Storage format of the processed files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes (1 processes sessions in this process)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read raw CSVs in chunks and write outputs incrementally to bound memory")
+    parser.add_argument("--chunksize", type=int, default=default_chunksize, help="Rows per chunk with --stream")
+    parser.add_argument("--manifest",
+                        help="Manifest of input fingerprints used to skip unchanged sessions (one per data type)")
+    parser.add_argument("--full", action="store_true", help="Reprocess every session, ignoring the manifest")
+    args = parser.parse_args(argv)
+
+    data_type = DATA_TYPES[args.data_type]
+    args.raw_dir = args.raw_dir or data_type.raw_dir
+    args.sublevel_dir = args.sublevel_dir or data_type.sublevel_dir
+    args.session_dir = args.session_dir or data_type.session_dir
+    args.metadata_dir = args.metadata_dir or data_type.metadata_dir
+    args.pyramid_dir = args.pyramid_dir or data_type.pyramid_dir
+    args.manifest = args.manifest or data_type.manifest_path("hrFix")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    # Check for Dircetories
+    os.makedirs(args.sublevel_dir, exist_ok=True)
+    os.makedirs(args.session_dir, exist_ok=True)
+
+    manifest = Manifest(args.manifest, config={
+        'sublevel_dir': args.sublevel_dir, 'session_dir': args.session_dir, 'metadata_dir': args.metadata_dir,
+        'pyramid_dir': args.pyramid_dir, 'pyramid_levels': list(pyramid_levels(data_type.sample_rate)),
+        'format': args.format,
+    })
+    failed = process_all_data(args.raw_dir, args.sublevel_dir, args.session_dir,
+                              workers=args.workers, manifest=manifest, full=args.full, fmt=args.format,
+                              chunksize=args.chunksize if args.stream else None, metadata_dir=args.metadata_dir,
+                              data_type=data_type, pyramid_dir=args.pyramid_dir)
+    manifest.save()
+    if failed:
+        logger.error("Processing finished with %d failed sessions: %s", len(failed), ", ".join(sorted(failed)))
+        return 1
+
+    logger.info("Processing completed.")
+    return 0
 
 # Run the script
-process_all_data(raw_sublevel_dir, processed_sublevel_dir, processed_session_dir)
-print("Processing completed.")
+if __name__ == "__main__":
+    sys.exit(main())
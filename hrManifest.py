@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+
+class Manifest:
+    """
+    Record of which input files produced which outputs, so a run only redoes sessions whose inputs changed.
+
+    Inputs are fingerprinted by size, mtime and a SHA-256 of their content. The hash is only recomputed
+    when the size or mtime changed, so an unchanged tree is checked with one stat per file.
+    """
+
+    def __init__(self, path, config=None):
+        self.path = path
+        self.config = config or {}
+        self.files = {}  # input path -> {"size", "mtime_ns", "sha256"}
+        self.units = {}  # unit name -> {"inputs": {path: sha256}, "outputs": [paths]}
+        self.config_changed = False
+        self.recorded = set()
+
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            self.files = saved.get("files", {})
+            self.units = saved.get("units", {})
+            # Outputs written with different settings can't be reused, but are still tracked so they get replaced
+            self.config_changed = saved.get("config", {}) != self.config
+
+    def fingerprint(self, path):
+        """Return the content hash of an input file, reusing the stored one if size and mtime match."""
+        stat = os.stat(path)
+        cached = self.files.get(path)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+
+        self.files[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+        return digest.hexdigest()
+
+    def is_current(self, unit, input_paths):
+        """True if the unit was built from exactly these inputs and all of its outputs still exist."""
+        recorded = self.units.get(unit)
+        if recorded is None or self.config_changed:
+            return False
+        if recorded["inputs"] != {path: self.fingerprint(path) for path in input_paths}:
+            return False
+        return all(os.path.exists(output) for output in recorded["outputs"])
+
+    def record(self, unit, input_paths, outputs):
+        """Store the outputs a unit produced and delete outputs it produced before but no longer does."""
+        previous = self.units.get(unit, {}).get("outputs", [])
+        self.recorded.add(unit)
+        self.units[unit] = {
+            "inputs": {path: self.fingerprint(path) for path in input_paths},
+            "outputs": list(outputs),
+        }
+        return remove_outputs(output for output in previous if output not in outputs)
+
+    def remove_missing_units(self, current_units):
+        """Forget units whose inputs disappeared and delete the outputs they produced."""
+        removed = []
+        for unit in [unit for unit in self.units if unit not in current_units]:
+            removed += remove_outputs(self.units.pop(unit)["outputs"])
+        return removed
+
+    def save(self):
+        """Write the manifest atomically, dropping fingerprints of inputs no unit uses any more."""
+        if self.config_changed:
+            # Units not rebuilt under the new settings must not look current on the next run
+            for unit, recorded in self.units.items():
+                if unit not in self.recorded:
+                    recorded["inputs"] = {}
+
+        used = {path for recorded in self.units.values() for path in recorded["inputs"]}
+        self.files = {path: info for path, info in self.files.items() if path in used}
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"config": self.config, "files": self.files, "units": self.units}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+def remove_outputs(outputs):
+    """Delete output files that exist, returning the ones removed."""
+    removed = []
+    for output in outputs:
+        if os.path.exists(output):
+            os.remove(output)
+            removed.append(output)
+    return removed
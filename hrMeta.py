@@ -1,61 +1,191 @@
+import argparse
+import csv
+import logging
 import os
+import sys
 import pandas as pd
 
-# Define directories
-original_base_dir = "Watch_data_org/heartrate_data"  # Original session folders
-processed_base_dir = "Processed_heartrate_sessions"  # Processed sessions folder
+from dataTypes import DATA_TYPES, HEARTRATE
+from hrManifest import Manifest
+from hrStore import DEFAULT_FORMAT, FORMATS, write_frame
 
-def generate_metadata_for_session(session_path, output_path):
+# Define directories (of heartrate; the other data types follow the same layout, see dataTypes.py)
+original_base_dir = HEARTRATE.raw_dir  # Original session folders
+metadata_base_dir = HEARTRATE.metadata_dir  # Metadata folder read by the app
+manifest_path = HEARTRATE.manifest_path("hrMeta")  # Input fingerprints from the last run
+
+logger = logging.getLogger("hrMeta")
+
+def metadata_path(base_dir, relative_session, fmt=DEFAULT_FORMAT):
+    """Metadata file of a session, e.g. heartrate_metadata/P1/Session_1/Session_1_metadata.parquet."""
+    return os.path.join(base_dir, relative_session, f"{os.path.basename(relative_session)}_metadata{FORMATS[fmt]}")
+
+def csv_time_bounds(file_path, block_size=4096):
     """
-    Generate metadata for a session based on the start of each sub-level and the 10-minute mark.
+    First and last watch_timestamp of a raw CSV, in file order, reading only its head and tail.
+    Returns None if the file has no watch_timestamp column or no data rows.
+    """
+    with open(file_path, "rb") as f:
+        header = next(csv.reader([f.readline().decode("utf-8-sig")]), [])
+        if "watch_timestamp" not in header:
+            return None
+        column = header.index("watch_timestamp")
+        data_start = f.tell()
+
+        first_line = f.readline()
+        while first_line and not first_line.strip():
+            first_line = f.readline()
+        if not first_line:
+            return None
+
+        # Read back from the end until the buffer holds a complete non-empty line
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while True:
+            position = max(position - block_size, data_start)
+            f.seek(position)
+            lines = [line for line in f.read(end - position).splitlines() if line.strip()]
+            if len(lines) > 1 or position == data_start:
+                break
+        last_line = lines[-1]
+
+    def timestamp(line):
+        return pd.to_datetime(next(csv.reader([line.decode("utf-8")]))[column])
+
+    return timestamp(first_line), timestamp(last_line)
+
+def session_markers(bounds):
+    """
+    Metadata markers for a session from the (first, last) timestamps of its sub-level files in filename
+    order: the start of each sub-level and the 10-minute mark. Returns None if there are no markers.
     """
     metadata = []
     total_duration = 0  # Track total time in seconds
     first_timestamp = None
 
-    # Process each CSV file in the session folder
-    for csv_file in sorted(os.listdir(session_path)):
-        if csv_file.endswith(".csv"):
-            file_path = os.path.join(session_path, csv_file)
-            df = pd.read_csv(file_path)
-            
-            # Get the first timestamp from the file
-            if 'watch_timestamp' in df:
-                timestamp = pd.to_datetime(df['watch_timestamp'].iloc[0])
-                if first_timestamp is None:
-                    first_timestamp = timestamp
-
-                # Add a metadata entry for the sub-level start
-                metadata.append({"timestamp": timestamp, "label": f"Sub-level {len(metadata) + 1} Start"})
-
-                # Update total duration based on the last timestamp in the file
-                last_timestamp = pd.to_datetime(df['watch_timestamp'].iloc[-1])
-                total_duration += (last_timestamp - timestamp).total_seconds()
+    for timestamp, last_timestamp in bounds:
+        if first_timestamp is None:
+            first_timestamp = timestamp
+
+        # Add a metadata entry for the sub-level start
+        metadata.append({"timestamp": timestamp, "label": f"Sub-level {len(metadata) + 1} Start"})
+
+        # Update total duration based on the last timestamp in the file
+        total_duration += (last_timestamp - timestamp).total_seconds()
 
     # Add a 10-minute mark if applicable
     if first_timestamp and total_duration >= 600:  # 600 seconds = 10 minutes
         ten_minute_mark = first_timestamp + pd.Timedelta(seconds=600)
         metadata.append({"timestamp": ten_minute_mark, "label": "10-minute mark"})
 
-    # Save metadata as a CSV
-    if metadata:
-        metadata_df = pd.DataFrame(metadata)
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        metadata_df.to_csv(output_path, index=False)
-        print(f"Metadata saved: {output_path}")
-    else:
-        print(f"No valid data for metadata generation in {session_path}")
+    return pd.DataFrame(metadata) if metadata else None
 
-def process_all_sessions(original_base_dir, processed_base_dir):
+def sublevel_bounds(metadata, number):
+    """
+    (start, end) of sub-level number (1-based) from a session's markers: its start marker and the start of the
+    next sub-level (None for the last one). Returns None if the session has no such sub-level.
     """
-    Generate metadata for all sessions and save in the processed sessions folder.
+    if metadata is None:
+        return None
+    starts = metadata.set_index("label")["timestamp"]
+    label = f"Sub-level {number} Start"
+    if label not in starts:
+        return None
+    next_label = f"Sub-level {number + 1} Start"
+    return starts[label], starts[next_label] if next_label in starts else None
+
+def write_session_metadata(bounds, output_path):
+    """Write the markers of a session (see session_markers). Returns True if a metadata file was written."""
+    metadata_df = session_markers(bounds)
+    if metadata_df is None:
+        return False
+    write_frame(metadata_df, output_path)
+    logger.info("Metadata saved: %s", output_path)
+    return True
+
+def generate_metadata_for_session(session_path, output_path):
     """
+    Generate metadata for a session based on the start of each sub-level and the 10-minute mark.
+    Only the first and last line of each CSV are read. Returns True if a metadata file was written.
+    """
+    bounds = []
+    for csv_file in sorted(os.listdir(session_path)):
+        if csv_file.endswith(".csv"):
+            file_bounds = csv_time_bounds(os.path.join(session_path, csv_file))
+            if file_bounds is not None:
+                bounds.append(file_bounds)
+
+    if write_session_metadata(bounds, output_path):
+        return True
+
+    logger.debug("No valid data for metadata generation in %s", session_path)
+    return False
+
+def process_all_sessions(original_base_dir, processed_base_dir, manifest=None, full=False, fmt=DEFAULT_FORMAT):
+    """
+    Generate metadata for all sessions and save it in the metadata folder. hrFix.py already writes the same
+    files while preprocessing; this regenerates only the metadata.
+    With a manifest only sessions whose CSVs changed are regenerated, and metadata of deleted sessions is removed.
+    Returns the list of sessions that failed.
+    """
+    sessions = {}
     for root, dirs, files in os.walk(original_base_dir):
         for dir_name in dirs:
             session_path = os.path.join(root, dir_name)
-            relative_path = os.path.relpath(session_path, original_base_dir)
-            output_path = os.path.join(processed_base_dir, relative_path, f"{dir_name}_metadata.csv")
-            generate_metadata_for_session(session_path, output_path)
+            sessions[os.path.relpath(session_path, original_base_dir)] = session_path
+
+    if manifest is not None:
+        for output in manifest.remove_missing_units(sessions):
+            logger.info("Removed metadata of deleted session: %s", output)
+
+    failed = []
+    for relative_path, session_path in sessions.items():
+        inputs = [os.path.join(session_path, file) for file in os.listdir(session_path) if file.endswith(".csv")]
+        if manifest is not None and not full and manifest.is_current(relative_path, inputs):
+            continue
+
+        output_path = metadata_path(processed_base_dir, relative_path, fmt)
+        try:
+            written = generate_metadata_for_session(session_path, output_path)
+        except Exception as e:
+            logger.error("Failed %s: %s", session_path, e)
+            failed.append(relative_path)
+            continue
+
+        if manifest is not None:
+            manifest.record(relative_path, inputs, [output_path] if written else [])
+
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate sub-level and 10-minute markers for every session.")
+    parser.add_argument("--data-type", choices=DATA_TYPES, default=HEARTRATE.name,
+                        help="Data stream to process; sets the default folders (see dataTypes.py)")
+    parser.add_argument("--raw-dir")
+    parser.add_argument("--output-dir")
+    parser.add_argument("--format", choices=FORMATS, default=DEFAULT_FORMAT,
+                        help="Storage format of the metadata files")
+    parser.add_argument("--manifest",
+                        help="Manifest of input fingerprints used to skip unchanged sessions (one per data type)")
+    parser.add_argument("--full", action="store_true", help="Regenerate every session, ignoring the manifest")
+    args = parser.parse_args(argv)
+
+    data_type = DATA_TYPES[args.data_type]
+    args.raw_dir = args.raw_dir or data_type.raw_dir
+    args.output_dir = args.output_dir or data_type.metadata_dir
+    args.manifest = args.manifest or data_type.manifest_path("hrMeta")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    manifest = Manifest(args.manifest, config={'output_dir': args.output_dir, 'format': args.format})
+    failed = process_all_sessions(args.raw_dir, args.output_dir, manifest=manifest, full=args.full, fmt=args.format)
+    manifest.save()
+
+    if failed:
+        logger.error("Metadata generation finished with %d failed sessions: %s", len(failed), ", ".join(sorted(failed)))
+        return 1
+    return 0
 
 # Run the metadata generation
-process_all_sessions(original_base_dir, processed_base_dir)
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import os
+import numpy as np
+import pandas as pd
+
+from hrStore import DEFAULT_FORMAT, FORMATS
+
+# Level-of-detail pyramid of a processed session, written by hrFix.py next to the session file:
+# Processed_<type>_pyramid/<P#|N#>/<Session>.<ext>, one row per bucket of 10, 60 and 600 samples (10 seconds,
+# 1 minute and 10 minutes of heartrate) with the min, mean and max of the plotted value, the number of rows and
+# valid readings, and the SR/ZERO errors. Zoomed-out session views are drawn from the coarsest level that still
+# has a bucket per pixel.
+
+PYRAMID_SAMPLES = (10, 60, 600)  # Samples per bucket at each level; each is a multiple of the first
+PYRAMID_COLUMNS = ["level", "start", "min", "mean", "max", "rows", "count", "sr_errors", "zero_errors"]
+
+NS_PER_SECOND = 1_000_000_000
+
+def pyramid_levels(sample_rate):
+    """Bucket seconds of each level for a stream sampled at sample_rate Hz, e.g. 0.2, 1.2 and 12 at 50 Hz."""
+    return tuple(samples / sample_rate for samples in PYRAMID_SAMPLES)
+
+def pyramid_path(base_dir, relative_session, fmt=DEFAULT_FORMAT):
+    """Pyramid file of a session ('P1/Session_1')."""
+    return os.path.join(base_dir, relative_session + FORMATS[fmt])
+
+def merge_buckets(parts, factor):
+    """
+    Combine bucket aggregates sorted by bucket into buckets factor times longer. Partial buckets split across
+    chunks are merged the same way.
+    """
+    buckets = parts["bucket"] // factor
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    merged = {"bucket": buckets[starts]}
+    merged["min"] = np.fmin.reduceat(parts["min"], starts)
+    merged["max"] = np.fmax.reduceat(parts["max"], starts)
+    for key in ("sum", "rows", "count", "sr_errors", "zero_errors"):
+        merged[key] = np.add.reduceat(parts[key], starts)
+    return merged
+
+class PyramidBuilder:
+    """
+    Build the pyramid of one session from its processed rows, added in time order in one or more chunks, so a
+    streamed session is never held whole. Each chunk is reduced to buckets of the finest level right away.
+    levels are the bucket seconds of each level (see pyramid_levels), by default those of a 1 Hz stream.
+    """
+
+    def __init__(self, value_column, time_column="watch_timestamp", levels=None):
+        self.value_column = value_column
+        self.time_column = time_column
+        self.levels = tuple(levels or pyramid_levels(1))
+        self.level_ns = [round(level * NS_PER_SECOND) for level in self.levels]
+        if any(ns % self.level_ns[0] for ns in self.level_ns):
+            raise ValueError(f"Pyramid levels must be multiples of the first: {self.levels}")
+        self.time_dtype = None
+        self._parts = []
+
+    def reset(self):
+        self._parts = []
+
+    def add(self, df):
+        if df.empty:
+            return
+        self.time_dtype = df[self.time_column].dtype
+        nanoseconds = df[self.time_column].to_numpy().astype("datetime64[ns]").view(np.int64)
+        values = df[self.value_column].to_numpy(dtype="float64", na_value=np.nan)
+        valid = ~np.isnan(values)
+        errors = df["DATA ERROR"].astype(str).to_numpy() if "DATA ERROR" in df else np.full(len(df), "")
+
+        # Every row is a bucket of its own, then rows are merged into buckets of the finest level
+        rows = {
+            "bucket": nanoseconds // self.level_ns[0],
+            "min": values,
+            "max": values,
+            "sum": np.where(valid, values, 0.0),
+            "rows": np.ones(len(df), dtype=np.int64),
+            "count": valid.astype(np.int64),
+            "sr_errors": (errors == "SR").astype(np.int64),
+            "zero_errors": (errors == "ZERO").astype(np.int64),
+        }
+        self._parts.append(merge_buckets(rows, 1))
+
+    def frame(self):
+        """The pyramid as a DataFrame sorted by level and bucket start (PYRAMID_COLUMNS)."""
+        if not self._parts:
+            return pd.DataFrame(columns=PYRAMID_COLUMNS)
+        finest = merge_buckets({key: np.concatenate([part[key] for part in self._parts]) for key in self._parts[0]}, 1)
+
+        frames = []
+        for level, level_ns in zip(self.levels, self.level_ns):
+            buckets = merge_buckets(finest, level_ns // self.level_ns[0])
+            count = buckets["count"]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.where(count > 0, buckets["sum"] / count, np.nan)
+            start = (buckets["bucket"] * level_ns).view("datetime64[ns]").astype(self.time_dtype)
+            frames.append(pd.DataFrame({
+                "level": np.full(len(start), level, dtype=np.float64),
+                "start": start,
+                "min": buckets["min"].astype(np.float32),
+                "mean": mean.astype(np.float32),
+                "max": buckets["max"].astype(np.float32),
+                "rows": buckets["rows"].astype(np.int32),
+                "count": count.astype(np.int32),
+                "sr_errors": buckets["sr_errors"].astype(np.int32),
+                "zero_errors": buckets["zero_errors"].astype(np.int32),
+            }))
+        return pd.concat(frames, ignore_index=True)
+
+def pick_level(pyramid, start=None, end=None, min_buckets=1):
+    """
+    Buckets of the coarsest level with at least min_buckets buckets between start and end (None for the start
+    or end of the session), plus one bucket beyond each edge. None if no level is fine enough, in which case
+    the samples themselves are needed.
+    """
+    for level in sorted(pyramid["level"].unique(), reverse=True):
+        rows = pyramid[pyramid["level"] == level]
+        starts = rows["start"].to_numpy().astype("datetime64[ns]").view(np.int64)
+        # The bucket holding start begins at most one level before it
+        first = np.searchsorted(starts, pd.Timestamp(start).as_unit("ns").value, side="right") - 2 \
+            if start is not None else 0
+        last = np.searchsorted(starts, pd.Timestamp(end).as_unit("ns").value, side="right") + 1 \
+            if end is not None else len(rows)
+        first, last = max(first, 0), min(last, len(rows))
+        if last - first >= min_buckets:
+            return rows.iloc[first:last]
+    return None
@@ -0,0 +1,182 @@
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from dataTypes import DATA_TYPES, HEARTRATE
+from hrFeatures import sublevel_label
+from hrStore import DEFAULT_FORMAT, FORMATS, find_data_file, is_data_file, read_frame, write_frame
+
+# Data-quality table of a data type, one row per processed sub-level file (participant/session/sub-level):
+# SR gaps, ZERO runs, coverage and runs of physiologically implausible readings, written to
+# data_quality/<data type>.<ext> and shown sortable on the app's /quality page.
+# Files whose size and mtime match the previous table are not read again.
+
+quality_dir = "data_quality"
+
+QUALITY_COLUMNS = [
+    "participant", "session", "sublevel", "start", "end", "rows", "coverage",
+    "gaps", "gap_seconds", "longest_gap_seconds",
+    "zero_runs", "zero_seconds", "longest_zero_seconds",
+    "implausible_runs", "implausible_seconds", "longest_implausible_seconds",
+    "path", "size", "mtime_ns",
+]
+COUNT_COLUMNS = ["rows", "gaps", "zero_runs", "implausible_runs"]
+SECONDS_COLUMNS = ["gap_seconds", "longest_gap_seconds", "zero_seconds", "longest_zero_seconds",
+                   "implausible_seconds", "longest_implausible_seconds"]
+
+logger = logging.getLogger("hrQuality")
+
+def quality_path(output_dir, data_type, fmt=DEFAULT_FORMAT):
+    """Quality table of a data type, e.g. data_quality/heartrate.parquet."""
+    return os.path.join(output_dir, data_type + FORMATS[fmt])
+
+def run_lengths(mask):
+    """Lengths of the runs of True in a boolean array, in order."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+
+def scan_frame(df, data_type=HEARTRATE):
+    """
+    Quality of one processed (gap-filled) frame. Gaps are runs of SR rows and zero runs are runs of ZERO rows.
+    Readings outside the data type's plausible_range are implausible; coverage is the fraction of rows
+    with a valid reading. Runs are measured in seconds of recording.
+    """
+    period = data_type.period.total_seconds()
+    errors = df["DATA ERROR"].astype(object).fillna("").to_numpy() if "DATA ERROR" in df else np.full(len(df), "")
+    values = df[data_type.summary_column].to_numpy(dtype="float64", na_value=np.nan)
+    valid = ~np.isnan(values) & (errors == "")
+    implausible = np.zeros(len(df), dtype=bool)
+    if data_type.plausible_range is not None:
+        low, high = data_type.plausible_range
+        implausible = valid & ((values < low) | (values > high))
+
+    row = {
+        "start": df["watch_timestamp"].iloc[0] if len(df) else pd.NaT,
+        "end": df["watch_timestamp"].iloc[-1] if len(df) else pd.NaT,
+        "rows": len(df),
+        "coverage": valid.mean() if len(df) else np.nan,
+    }
+    for name, mask in (("gap", errors == "SR"), ("zero", errors == "ZERO"), ("implausible", implausible)):
+        lengths = run_lengths(mask)
+        row["gaps" if name == "gap" else f"{name}_runs"] = len(lengths)
+        row[f"{name}_seconds"] = lengths.sum() * period
+        row[f"longest_{name}_seconds"] = lengths.max() * period if len(lengths) else 0.0
+    return row
+
+def scan_session(participant, session, paths, data_type_name):
+    """Quality rows of the given sub-level files of one session."""
+    data_type = DATA_TYPES[data_type_name]
+    rows = []
+    for path in paths:
+        stat = os.stat(path)
+        row = scan_frame(read_frame(path), data_type)
+        row.update(participant=participant, session=session, sublevel=sublevel_label(os.path.basename(path)),
+                   path=path, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        rows.append(row)
+    return rows
+
+def find_sublevel_files(sublevel_dir):
+    """(participant, session) -> processed sub-level files, for every session folder."""
+    sessions = {}
+    for root, dirs, files in os.walk(sublevel_dir):
+        dirs.sort()
+        paths = [os.path.join(root, file) for file in sorted(files) if is_data_file(file)]
+        relative = os.path.relpath(root, sublevel_dir).split(os.sep)
+        if paths and len(relative) == 2:
+            sessions[tuple(relative)] = paths
+    return sessions
+
+def compact_table(rows):
+    """Quality rows as a DataFrame of QUALITY_COLUMNS with categorical labels and 32-bit numbers."""
+    table = pd.DataFrame(rows, columns=QUALITY_COLUMNS)
+    table = table.astype({column: "int32" for column in COUNT_COLUMNS}
+                         | {column: "float32" for column in SECONDS_COLUMNS + ["coverage"]})
+    for column in ("participant", "session", "sublevel"):
+        table[column] = table[column].astype("category")
+    return table.sort_values(["participant", "session", "start"], kind="mergesort").reset_index(drop=True)
+
+def scan_all(sublevel_dir, data_type=HEARTRATE, workers=None, previous=None):
+    """
+    Quality table of every processed sub-level file, one session per worker process. Rows of previous (an
+    earlier table) are reused for files whose size and mtime haven't changed. Returns the table and the
+    list of sessions that failed.
+    """
+    reused = {}
+    if previous is not None:
+        reused = {row["path"]: row for row in previous.to_dict("records")}
+
+    rows = []
+    units = {}
+    for session, paths in find_sublevel_files(sublevel_dir).items():
+        changed = []
+        for path in paths:
+            stat = os.stat(path)
+            row = reused.get(path)
+            if row is not None and (row["size"], row["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                rows.append(row)
+            else:
+                changed.append(path)
+        if changed:
+            units[session] = changed
+    logger.info("%d files unchanged, %d sessions to scan", len(rows), len(units))
+
+    failed = []
+    if workers == 1:
+        for (participant, session), paths in units.items():
+            try:
+                rows += scan_session(participant, session, paths, data_type.name)
+            except Exception as e:
+                failed.append(f"{participant}/{session}")
+                logger.error("Failed %s/%s: %s", participant, session, e)
+        return compact_table(rows), failed
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(scan_session, participant, session, paths, data_type.name): f"{participant}/{session}"
+            for (participant, session), paths in units.items()
+        }
+        for future in as_completed(futures):
+            try:
+                rows += future.result()
+            except Exception as e:
+                failed.append(futures[future])
+                logger.error("Failed %s: %s", futures[future], e)
+    return compact_table(rows), failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Scan the processed sub-level files for gaps, zero runs and implausible readings.")
+    parser.add_argument("--data-type", choices=DATA_TYPES, default=HEARTRATE.name,
+                        help="Data stream to scan; sets the default folders (see dataTypes.py)")
+    parser.add_argument("--sublevel-dir")
+    parser.add_argument("--output-dir", default=quality_dir)
+    parser.add_argument("--format", choices=FORMATS, default=DEFAULT_FORMAT, help="Storage format of the table")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes (1 scans in this process)")
+    parser.add_argument("--full", action="store_true", help="Scan every file, ignoring the previous table")
+    args = parser.parse_args(argv)
+
+    data_type = DATA_TYPES[args.data_type]
+    args.sublevel_dir = args.sublevel_dir or data_type.sublevel_dir
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    output_file = quality_path(args.output_dir, data_type.name, args.format)
+    previous_file = find_data_file(output_file)
+    previous = read_frame(previous_file) if previous_file and not args.full else None
+    table, failed = scan_all(args.sublevel_dir, data_type, workers=args.workers, previous=previous)
+    write_frame(table, output_file)
+    logger.info("Quality of %d sub-levels saved: %s", len(table), output_file)
+
+    if failed:
+        logger.error("Scan finished with %d failed sessions: %s", len(failed), ", ".join(sorted(failed)))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
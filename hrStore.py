@@ -0,0 +1,221 @@
+import argparse
+import os
+import sys
+import pandas as pd
+
+from dataTypes import compact_columns
+
+# File extension for each supported storage format. Parquet and Feather need pyarrow.
+FORMATS = {"parquet": ".parquet", "feather": ".feather", "csv": ".csv"}
+DEFAULT_FORMAT = "parquet"
+
+# Rows per Parquet row group: an hour of 1 Hz data. Each row group records the range of its timestamps,
+# so a time window is read from the row groups it overlaps instead of the whole file (read_frame_window).
+ROW_GROUP_ROWS = 3600
+
+# Columns holding timestamps, and the fixed set of values in the DATA ERROR column
+TIMESTAMP_COLUMNS = ("watch_timestamp", "timestamp")
+ERROR_CATEGORIES = ["", "SR", "ZERO"]
+
+def is_data_file(filename):
+    """True if the file is stored in one of the supported formats."""
+    return os.path.splitext(filename)[1] in FORMATS.values()
+
+def with_format(path, fmt):
+    """Swap the extension of a path for the one used by the given format."""
+    return os.path.splitext(path)[0] + FORMATS[fmt]
+
+def find_data_file(path):
+    """
+    Find an existing file for a path given with or without an extension, trying columnar formats before CSV.
+    Returns None if the data isn't stored in any format.
+    """
+    base = os.path.splitext(path)[0] if is_data_file(path) else path
+    for extension in FORMATS.values():
+        if os.path.exists(base + extension):
+            return base + extension
+    return None
+
+def typed_frame(df):
+    """
+    Convert a processed frame to compact column types: datetime timestamps, float32 values of every
+    registered data type (bpm, x/y/z, ...; NaN for missing) and a categorical DATA ERROR column.
+    """
+    df = df.copy()
+    for column in TIMESTAMP_COLUMNS:
+        if column in df and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = pd.to_datetime(df[column], format="ISO8601")
+    for column in compact_columns() & set(df.columns):
+        df[column] = df[column].astype('float32')
+    if 'DATA ERROR' in df:
+        errors = df['DATA ERROR'].fillna("").astype(str)
+        extra = sorted(set(errors.unique()) - set(ERROR_CATEGORIES))
+        df['DATA ERROR'] = pd.Categorical(errors, categories=ERROR_CATEGORIES + extra)
+    if 'label' in df:
+        df['label'] = df['label'].astype('category')
+    return df
+
+def write_frame(df, path):
+    """Save a frame in the format given by the path's extension."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    extension = os.path.splitext(path)[1]
+    if extension == FORMATS["csv"]:
+        df.to_csv(path, index=False)
+    elif extension == FORMATS["parquet"]:
+        typed_frame(df).to_parquet(path, index=False, row_group_size=ROW_GROUP_ROWS)
+    elif extension == FORMATS["feather"]:
+        typed_frame(df).reset_index(drop=True).to_feather(path)
+    else:
+        raise ValueError(f"Unsupported data file format: {path}")
+
+class FrameWriter:
+    """
+    Write a frame piece by piece, for outputs too large to build in memory. Pieces go to a temporary file
+    that replaces path on close, so readers never see a half-written output. Use as a context manager.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".partial"
+        self.format = next((fmt for fmt, ext in FORMATS.items() if path.endswith(ext)), None)
+        if self.format is None:
+            raise ValueError(f"Unsupported data file format: {path}")
+        self.rows = 0
+        self._schema = None
+        self._writer = None
+
+    def write(self, df):
+        if df.empty:
+            return
+        if self.rows == 0:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        if self.format == "csv":
+            # The first piece truncates whatever an interrupted run left in the temporary file
+            df.to_csv(self.tmp_path, mode="w" if self.rows == 0 else "a", header=self.rows == 0, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            # Every piece is cast to the schema of the first so the file has one consistent schema
+            table = pa.Table.from_pandas(typed_frame(df), schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                if self.format == "parquet":
+                    self._writer = pq.ParquetWriter(self.tmp_path, self._schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.tmp_path, self._schema)
+            self._writer.write_table(table, **({"row_group_size": ROW_GROUP_ROWS} if self.format == "parquet" else {}))
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self.rows:
+            os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+def read_frame(path, columns=None):
+    """Load a frame saved by write_frame, with timestamp columns parsed whatever the format."""
+    extension = os.path.splitext(path)[1]
+    if extension == FORMATS["parquet"]:
+        return pd.read_parquet(path, columns=columns)
+    if extension == FORMATS["feather"]:
+        return pd.read_feather(path, columns=columns)
+    if extension != FORMATS["csv"]:
+        raise ValueError(f"Unsupported data file format: {path}")
+
+    df = pd.read_csv(path, usecols=columns)
+    for column in TIMESTAMP_COLUMNS:
+        if column in df:
+            df[column] = pd.to_datetime(df[column], format="ISO8601")
+    if 'DATA ERROR' in df:
+        df['DATA ERROR'] = df['DATA ERROR'].fillna("")
+    return df
+
+def row_group_range(metadata, column, start, end):
+    """
+    First and last row group (inclusive) of a Parquet file holding rows between start and end, widened by one
+    row group on each side so the rows just outside the window are included. None without timestamp statistics.
+    """
+    position = metadata.schema.names.index(column)
+    ranges = []
+    for i in range(metadata.num_row_groups):
+        statistics = metadata.row_group(i).column(position).statistics
+        if statistics is None or not statistics.has_min_max:
+            return None
+        ranges.append((pd.Timestamp(statistics.min), pd.Timestamp(statistics.max)))
+    if not ranges:
+        return None
+
+    # First group ending at or after start and last group beginning at or before end
+    first = next((i for i, (_, high) in enumerate(ranges) if start is None or high >= start), len(ranges) - 1)
+    last = next((i for i in reversed(range(len(ranges))) if end is None or ranges[i][0] <= end), 0)
+    first, last = min(first, last), max(first, last)
+    return max(first - 1, 0), min(last + 1, len(ranges) - 1)
+
+def read_frame_window(path, start=None, end=None, time_column="watch_timestamp"):
+    """
+    Rows of a time-sorted frame around start..end, as (df, first_row, total_rows): df is indexed by row number in
+    the file, from first_row. Parquet files are only read from the row groups overlapping the window; files in
+    other formats or without timestamp statistics are read whole.
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    if os.path.splitext(path)[1] == FORMATS["parquet"]:
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        metadata = parquet_file.metadata
+        groups = row_group_range(metadata, time_column, start, end) if time_column in metadata.schema.names else None
+        if groups is not None:
+            first_row = sum(metadata.row_group(i).num_rows for i in range(groups[0]))
+            df = parquet_file.read_row_groups(range(groups[0], groups[1] + 1)).to_pandas()
+            df.index = pd.RangeIndex(first_row, first_row + len(df))
+            return df, first_row, metadata.num_rows
+
+    df = read_frame(path)
+    return df, 0, len(df)
+
+def convert_tree(source_dir, target_dir, fmt):
+    """Copy every data file under source_dir into target_dir in another format (e.g. to export CSVs)."""
+    converted = []
+    for root, _, files in os.walk(source_dir):
+        for file in files:
+            if not is_data_file(file):
+                continue
+            source = os.path.join(root, file)
+            target = with_format(os.path.join(target_dir, os.path.relpath(source, source_dir)), fmt)
+            write_frame(read_frame(source), target)
+            converted.append(target)
+    return converted
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert processed data between CSV, Parquet and Feather.")
+    parser.add_argument("source_dir")
+    parser.add_argument("target_dir")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    args = parser.parse_args(argv)
+
+    converted = convert_tree(args.source_dir, args.target_dir, args.format)
+    print(f"Converted {len(converted)} files into {args.target_dir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+from dataTypes import HEARTRATE
+
+# Generate synthetic Watch_data_org trees for testing and benchmarking, laid out like the real exports:
+# Watch_data_org/heartrate_data/<P#|N#>/Session_<n>/watch_<participant>_L<level>_S<sublevel>_<randgenID>_heartrate.csv
+
+def synth_recording(start, duration, rng, dropout_rate=0.02, zero_rate=0.01, mean_gap=8):
+    """
+    One sub-level recording at 1 Hz lasting duration seconds. bpm follows a slow random walk around a
+    resting rate. Dropouts remove runs of seconds (mean length mean_gap) and zero readings replace short
+    runs with 0, the two cases hrFix tags as SR and ZERO.
+    """
+    seconds = np.arange(duration)
+    bpm = 72 + np.cumsum(rng.normal(0, 0.4, duration)) + rng.normal(0, 2, duration)
+    bpm = np.clip(np.round(bpm), 40, 190).astype(np.int64)
+
+    def runs(rate, mean_length):
+        mask = np.zeros(duration, dtype=bool)
+        starts = np.flatnonzero(rng.random(duration) < rate / mean_length)
+        lengths = rng.geometric(1 / mean_length, len(starts))
+        for run_start, length in zip(starts, lengths):
+            mask[run_start:run_start + length] = True
+        return mask
+
+    bpm[runs(zero_rate, 3)] = 0
+    keep = ~runs(dropout_rate, mean_gap)
+    keep[0] = True
+
+    timestamps = pd.Timestamp(start) + pd.to_timedelta(seconds[keep], unit="s")
+    return pd.DataFrame({"watch_timestamp": timestamps.strftime("%Y-%m-%d %H:%M:%S"), "bpm": bpm[keep]})
+
+def generate_watch_tree(base_dir, participants=4, sessions=3, sublevels=3, duration=600,
+                        dropout_rate=0.02, zero_rate=0.01, seed=0):
+    """
+    Write a Watch_data_org tree under base_dir with half P (ADHD) and half N (non-ADHD) participants.
+    duration is the length of each sub-level in seconds. Returns the paths written.
+    """
+    rng = np.random.default_rng(seed)
+    raw_dir = os.path.join(base_dir, HEARTRATE.raw_dir)
+    ids = [f"P{i + 1}" for i in range((participants + 1) // 2)] + [f"N{i + 1}" for i in range(participants // 2)]
+
+    paths = []
+    for participant in ids:
+        for session in range(1, sessions + 1):
+            session_dir = os.path.join(raw_dir, participant, f"Session_{session}")
+            os.makedirs(session_dir, exist_ok=True)
+
+            start = pd.Timestamp("2024-01-01 09:00:00") + pd.Timedelta(days=session)
+            for sublevel in range(1, sublevels + 1):
+                df = synth_recording(start, duration, rng, dropout_rate, zero_rate)
+                randgen_id = rng.integers(1000000, 9999999)
+                path = os.path.join(session_dir, f"watch_{participant}_L1_S{sublevel}_{randgen_id}_heartrate.csv")
+                df.to_csv(path, index=False)
+                paths.append(path)
+
+                # Short break between sub-levels
+                start += pd.Timedelta(seconds=duration + 30)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic Watch_data_org tree.")
+    parser.add_argument("base_dir", help="Folder that will contain Watch_data_org")
+    parser.add_argument("--participants", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=3)
+    parser.add_argument("--sublevels", type=int, default=3)
+    parser.add_argument("--duration", type=int, default=600, help="Seconds per sub-level")
+    parser.add_argument("--dropout-rate", type=float, default=0.02, help="Fraction of seconds missing")
+    parser.add_argument("--zero-rate", type=float, default=0.01, help="Fraction of seconds reading 0 bpm")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    paths = generate_watch_tree(args.base_dir, args.participants, args.sessions, args.sublevels, args.duration,
+                                args.dropout_rate, args.zero_rate, args.seed)
+    print(f"Wrote {len(paths)} files under {os.path.join(args.base_dir, 'Watch_data_org')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
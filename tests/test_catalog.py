@@ -0,0 +1,59 @@
+import os
+
+import pandas as pd
+
+os.environ.setdefault("MINDMAP_WATCH_INTERVAL", "0")
+
+from application.catalog import DataCatalog
+from hrStore import write_frame
+
+def session_frame(bpm):
+    return pd.DataFrame({
+        "watch_timestamp": pd.date_range("2024-01-01 10:00", periods=60, freq="s"),
+        "bpm": [bpm] * 60,
+        "DATA ERROR": [""] * 60,
+    })
+
+def test_rewritten_file_is_read_again(tmp_path):
+    path = str(tmp_path / "Session_1.parquet")
+    catalog = DataCatalog(str(tmp_path), cache_bytes=1 << 20)
+
+    write_frame(session_frame(70), path)
+    assert catalog.load(path)["bpm"].iloc[0] == 70
+    assert catalog.load_session(path).columns["bpm"][0] == 70
+
+    write_frame(session_frame(80), path)
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1_000_000_000))
+    assert catalog.load(path)["bpm"].iloc[0] == 80
+    assert catalog.load_session(path).columns["bpm"][0] == 80
+    assert catalog.load_session_window(path).columns["bpm"][0] == 80
+    assert catalog.cache_info()["entries"] == 2
+
+def test_file_rewritten_during_read_is_not_cached(tmp_path, monkeypatch):
+    import application.catalog
+
+    path = str(tmp_path / "Session_1.parquet")
+    write_frame(session_frame(70), path)
+    read_frame = application.catalog.read_frame
+
+    def read_then_rewrite(path):
+        df = read_frame(path)
+        write_frame(session_frame(80), path)
+        os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1_000_000_000))
+        return df
+
+    catalog = DataCatalog(str(tmp_path), cache_bytes=1 << 20)
+    monkeypatch.setattr(application.catalog, "read_frame", read_then_rewrite)
+    assert catalog.load(path)["bpm"].iloc[0] == 70
+    assert catalog.cache_info()["entries"] == 0
+
+    monkeypatch.setattr(application.catalog, "read_frame", read_frame)
+    assert catalog.load(path)["bpm"].iloc[0] == 80
+
+def test_index_page_without_sessions(monkeypatch):
+    from application import app, routes
+
+    # An index the watcher replaced between reads: the participant is still listed but has no sessions
+    monkeypatch.setattr(routes.catalog, "index", {"heartrate": {"P1": {}}})
+    response = app.test_client().get("/?data_type=heartrate&participant=P1")
+    assert response.status_code == 200
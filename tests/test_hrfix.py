@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from hrFix import add_missing_seconds
+
+# Row-by-row gap filling that add_missing_seconds replaced; the vectorized version must give the same frame.
+def reference_add_missing_seconds(df):
+
+    new_rows = []
+    for i in range(len(df) - 1):
+        current_row = df.iloc[i].to_dict()
+
+        # Mark ZERO error if bpm is 0
+        if current_row['bpm'] == 0:
+            current_row['bpm'] = None
+            current_row['DATA ERROR'] = "ZERO"
+        else:
+            current_row['DATA ERROR'] = ""
+
+        new_rows.append(current_row)
+
+        # Add rows for missing seconds
+        time_diff = (df.iloc[i + 1]['watch_timestamp'] - df.iloc[i]['watch_timestamp']).total_seconds()
+        if time_diff > 1:
+            current_time = df.iloc[i]['watch_timestamp']
+            for _ in range(int(time_diff) - 1):
+                current_time += pd.Timedelta(seconds=1)
+                new_rows.append({
+                    'watch_timestamp': current_time,
+                    'bpm': None,
+                    'DATA ERROR': "SR"  # Sample Rate error
+                })
+
+    # Process the last row
+    last_row = df.iloc[-1].to_dict()
+    if last_row['bpm'] == 0:
+        last_row['bpm'] = None
+        last_row['DATA ERROR'] = "ZERO"
+    else:
+        last_row['DATA ERROR'] = ""
+
+    new_rows.append(last_row)
+    return pd.DataFrame(new_rows)
+
+def frame(timestamps, bpm, **columns):
+    return pd.DataFrame({"watch_timestamp": pd.to_datetime(timestamps), "bpm": bpm, **columns})
+
+CASES = {
+    "no gaps": frame(["2024-01-01 09:00:00", "2024-01-01 09:00:01", "2024-01-01 09:00:02"], [70, 71, 72]),
+    "gaps": frame(["2024-01-01 09:00:00", "2024-01-01 09:00:04", "2024-01-01 09:00:05", "2024-01-01 09:00:30"],
+                  [70, 71, 72, 73]),
+    "zero rows": frame(["2024-01-01 09:00:00", "2024-01-01 09:00:01", "2024-01-01 09:00:03", "2024-01-01 09:00:04"],
+                       [0, 71, 0, 0]),
+    "extra columns": frame(["2024-01-01 09:00:00", "2024-01-01 09:00:03", "2024-01-01 09:00:04"], [70, 0, 72],
+                           device=["a", "b", "c"], battery=[0.9, 0.8, 0.7]),
+    "duplicate timestamps": frame(["2024-01-01 09:00:00", "2024-01-01 09:00:00", "2024-01-01 09:00:03"],
+                                  [70, 71, 72]),
+    "tz-aware timestamps": frame(["2024-01-01 09:00:00+01:00", "2024-01-01 09:00:02+01:00",
+                                  "2024-01-01 09:00:06+01:00"], [70, 0, 72]),
+}
+
+@pytest.mark.parametrize("name", CASES)
+def test_matches_row_loop(name):
+    df = CASES[name]
+    pd.testing.assert_frame_equal(add_missing_seconds(df), reference_add_missing_seconds(df), check_dtype=False)
@@ -0,0 +1,34 @@
+import os
+
+import pandas as pd
+
+os.environ.setdefault("MINDMAP_WATCH_INTERVAL", "0")
+
+from application.cohort import cohort_statistics, cohort_table
+from application.plots import cohort_figure
+
+def test_cohort_trajectories_are_lines():
+    summary = pd.DataFrame([
+        {"participant": participant, "session": f"Session_{session}", "count": 60, "mean": 70.0 + session + offset}
+        for offset, participant in enumerate(["P1", "P2", "N1", "N2"]) for session in (1, 2, 3)
+    ])
+    table = cohort_table(summary)
+    fig = cohort_figure(table, cohort_statistics(table), "heartrate")
+
+    traces = [trace for trace in fig.data if trace.name.endswith("participants")]
+    assert traces
+    for trace in traces:
+        # Split the trace at its gaps: every participant must be a line through all of its sessions
+        segments, current = [], []
+        for x, text in zip(trace.x, trace.text):
+            if x is None:
+                segments.append(current)
+                current = []
+            else:
+                current.append((text, x))
+        segments.append(current)
+        assert len(segments) == 2
+        for segment in segments:
+            assert len(segment) > 1
+            assert len({participant for participant, _ in segment}) == 1
+            assert [session for _, session in segment] == ["Session_1", "Session_2", "Session_3"]
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from hrPyramid import PyramidBuilder, pick_level, pyramid_levels
+
+def accelerometer_frame(seconds):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "watch_timestamp": pd.date_range("2024-01-01 10:00:00.04", periods=seconds * 50, freq="20ms"),
+        "magnitude": rng.uniform(9, 11, seconds * 50),
+        "DATA ERROR": [""] * (seconds * 50),
+    })
+
+def test_levels_follow_the_sample_rate():
+    assert pyramid_levels(1) == (10, 60, 600)
+    assert pyramid_levels(50) == (0.2, 1.2, 12)
+
+def test_streamed_pyramid_matches_whole_session():
+    df = accelerometer_frame(600)
+    whole = PyramidBuilder("magnitude", levels=pyramid_levels(50))
+    whole.add(df)
+    streamed = PyramidBuilder("magnitude", levels=pyramid_levels(50))
+    for start in range(0, len(df), 997):
+        streamed.add(df.iloc[start:start + 997])
+    pd.testing.assert_frame_equal(whole.frame(), streamed.frame())
+
+    # Every bucket of a level holds the same number of samples, so a level is a bucket per pixel at some width
+    pyramid = whole.frame()
+    assert pyramid.groupby("level")["rows"].max().tolist() == [10, 60, 600]
+    assert pick_level(pyramid, min_buckets=400)["level"].iloc[0] == 1.2